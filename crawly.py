@@ -1,50 +1,279 @@
-import pickle
+"""
+Command line interface of the scraper
+
+    python crawly.py crawl  --write_dir=my_write_dir
+    python crawly.py resume --write_dir=my_write_dir
+    python crawly.py update --write_dir=my_write_dir
+    python crawly.py fedlex --write_dir=my_write_dir
+    python crawly.py stats  --write_dir=my_write_dir
+    python crawly.py export --write_dir=my_write_dir --formats=jsonl,parquet
+
+The scraper modules (bs4, selenium, requests) are only imported by the
+subcommands that need them, stats only reads the crawl state summary.
+"""
 import os
+import sys
+import json
+import time
 import argparse
 
-from src.scraper import AstraScraper
-from src.utils.adminlink import string_filter
+
+def _state_path(write_dir):
+    return os.path.join(write_dir, '_overview', 'crawl_state.pkl')
+
+
+def _make_scraper(args):
+    from src.scraper import AstraScraper
+    from src.utils.scheduler import CrawlScheduler
+    from src.utils.admission import AdmissionControl
+    from src.utils.transport import HttpTransport
+
+    scheduler = CrawlScheduler(max_depth=args.max_depth,
+                               max_pages=args.max_pages,
+                               max_seconds=args.max_seconds)
+    transport = HttpTransport(store_dir=args.transport_dir,
+                              mode=args.transport_mode)
+    admission = AdmissionControl() if args.admission else None
+
+    return AstraScraper(memory_budget=args.memory_budget,
+                        scheduler=scheduler,
+                        admission=admission,
+                        transport=transport)
+
+
+def _run_crawl(args, scraper, begin, export_name):
+    """
+    Crawl with the knowledge base streamed to write_dir/overview and the
+    crawl state saved to write_dir/_overview/crawl_state.pkl
+    """
+    from src.utils.adminlink import string_filter
+    from src.utils.export import RecordExporter, KNOWLEDGE_BASE_FIELDS
+
+    with RecordExporter(os.path.join(args.write_dir, 'overview'),
+                        export_name,
+                        KNOWLEDGE_BASE_FIELDS,
+                        formats=args.export_formats.split(',')) as exporter:
+        try:
+            scraper.crawl_page(
+                write_dir=args.write_dir,
+                write=args.write,
+                verbose=args.verbose,
+                filter_function=string_filter,
+                filter_string=args.filter_string,
+                begin=begin,
+                exporter=exporter,
+                initial_url=args.initial_url,
+                domain_url=args.domain_url,
+            )
+        finally:
+            scraper.state.save(_state_path(args.write_dir))
+            scraper.transport.close()
+
+
+def _load_state(write_dir):
+    from src.utils.crawlstate import CrawlState
+
+    path = _state_path(write_dir)
+    if not os.path.exists(path):
+        sys.exit(f'no crawl state found at {path}, run crawl first')
+    return CrawlState.load(path)
+
 
 def crawly_go_crawl(args):
     """
-    Crawler utility to be used on a command line call
+    Crawler utility to be used on a command line call. The knowledge base
+    is streamed to write_dir/overview/knowledge_base.(jsonl|parquet) while
+    crawling, only the compact crawl state is pickled.
+    """
+    scraper = _make_scraper(args)
+    _run_crawl(args, scraper, begin=True, export_name='knowledge_base')
+
+
+def crawly_resume(args):
+    """
+    Continue an interrupted crawl from its last saved crawl state
+    """
+    state = _load_state(args.write_dir)
+    if args.memory_budget is not None:
+        state.memory_budget = args.memory_budget
+
+    scraper = _make_scraper(args)
+    scraper.restore_state(args.write_dir, state)
+    _run_crawl(args, scraper, begin=False,
+               export_name=f"knowledge_base_resume_{time.strftime('%Y%m%d_%H%M%S')}")
+
+
+def crawly_update(args):
+    """
+    Recrawl a finished crawl: all crawled (and skipped) urls are put back on
+    the frontier, unchanged files are detected with HEAD requests
+    """
+    from src.utils.crawlstate import DONE, SKIPPED
+
+    state = _load_state(args.write_dir)
+    # unchanged files are only detected with the admission control, so it
+    # is on unless --no-admission is given
+    if args.admission is None:
+        args.admission = True
+    scraper = _make_scraper(args)
+    scraper.restore_state(args.write_dir, state)
+    scraper.domain_url = args.domain_url
+
+    n_requeued = state.requeue(flags=(DONE, SKIPPED),
+                               priority_function=scraper._link_priority)
+    state.push(state.intern(args.initial_url))
+    print(f'requeued {n_requeued} urls')
+
+    _run_crawl(args, scraper, begin=False,
+               export_name=f"knowledge_base_update_{time.strftime('%Y%m%d_%H%M%S')}")
+
+
+def crawly_fedlex(args):
+    """
+    Crawl all laws in force from fedlex, the legal metadata and citations
+    are streamed to write_dir/overview/legal_knowledge.(jsonl|parquet). With
+    --delta only the laws that changed since the last --delta run are
+    crawled (versions kept in write_dir/_overview/fedlex_versions.json)
+    """
+    from src.scraper import FedlexScraper
+    from src.utils.export import RecordExporter, LEGAL_FIELDS
+    from src.utils.transport import HttpTransport
+
+    legal_dir = os.path.join(args.write_dir, 'legal')
+    os.makedirs(legal_dir, exist_ok=True)
+
+    transport = HttpTransport(store_dir=args.transport_dir,
+                              mode=args.transport_mode)
+    scraper = FedlexScraper(transport=transport)
+    export_name = 'legal_knowledge'
+    if args.delta:
+        export_name = f"legal_knowledge_delta_{time.strftime('%Y%m%d_%H%M%S')}"
+
+    with RecordExporter(os.path.join(args.write_dir, 'overview'),
+                        export_name,
+                        LEGAL_FIELDS,
+                        formats=args.export_formats.split(',')) as exporter:
+        try:
+            if args.delta:
+                report = scraper.refresh(os.path.join(args.write_dir, '_overview', 'fedlex_versions.json'),
+                                         write_dir=legal_dir,
+                                         exporter=exporter)
+                print(json.dumps(report, indent=2))
+            else:
+                scraper._scrap_feldex(reset_counter=args.reset_counter,
+                                      exporter=exporter,
+                                      write_dir=legal_dir)
+        finally:
+            transport.close()
+
+
+def crawly_stats(args):
+    """
+    Print the summary of the saved crawl state (without loading it unless
+    --full is given)
     """
-    scraper = AstraScraper()
+    path = _state_path(args.write_dir)
+    if args.full:
+        summary = _load_state(args.write_dir).memory_report()
+    else:
+        from src.utils.crawlstate import CrawlState
+        try:
+            summary = CrawlState.read_summary(path)
+        except FileNotFoundError:
+            sys.exit(f'no crawl state summary found for {path}, run crawl first')
+    print(json.dumps(summary, indent=2))
+
+
+def crawly_export(args):
+    """
+    Export the full knowledge base of the saved crawl state
+    """
+    from src.utils.crawlstate import KnowledgeBaseView
+    from src.utils.export import RecordExporter, KNOWLEDGE_BASE_FIELDS
+
+    knowledge_base = KnowledgeBaseView(_load_state(args.write_dir))
+    with RecordExporter(os.path.join(args.write_dir, 'overview'),
+                        args.name,
+                        KNOWLEDGE_BASE_FIELDS,
+                        formats=args.formats.split(',')) as exporter:
+        for url, entry in knowledge_base.items():
+            exporter.write({'url': url, **entry})
+    print(f'exported {exporter.n_written} records')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Scraper for ASTRA and fedlex')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    # shared arguments
+    base = argparse.ArgumentParser(add_help=False)
+    base.add_argument('--write_dir', type=str, required=True)
+
+    transport = argparse.ArgumentParser(add_help=False)
+    transport.add_argument('--transport_mode',
+                           choices=['live', 'record', 'replay'],
+                           default='live')
+    transport.add_argument('--transport_dir', type=str, default=None)
+    transport.add_argument('--export_formats', type=str, default='jsonl')
+
+    crawling = argparse.ArgumentParser(add_help=False)
+    crawling.add_argument('--write',
+                          action=argparse.BooleanOptionalAction,
+                          default=True)
+    crawling.add_argument('--verbose',
+                          action=argparse.BooleanOptionalAction,
+                          default=True)
+    crawling.add_argument('--filter_string',
+                          type=str,
+                          default='astra/de|classified-compilation|fedlex')
+    crawling.add_argument('--initial_url',
+                          type=str,
+                          default='https://www.astra.admin.ch/astra/de/home.html')
+    crawling.add_argument('--domain_url',
+                          type=str,
+                          default='https://www.astra.admin.ch')
+    crawling.add_argument('--memory_budget', type=int, default=None)
+    crawling.add_argument('--max_pages', type=int, default=None)
+    crawling.add_argument('--max_depth', type=int, default=None)
+    crawling.add_argument('--max_seconds', type=float, default=None)
+    # None: off for crawl and resume, on for update
+    crawling.add_argument('--admission',
+                          action=argparse.BooleanOptionalAction,
+                          default=None)
+
+    parser_crawl = subparsers.add_parser('crawl', parents=[base, transport, crawling],
+                                         help='start a new crawl')
+    parser_crawl.set_defaults(function=crawly_go_crawl)
+
+    parser_resume = subparsers.add_parser('resume', parents=[base, transport, crawling],
+                                          help='continue from the saved crawl state')
+    parser_resume.set_defaults(function=crawly_resume)
+
+    parser_update = subparsers.add_parser('update', parents=[base, transport, crawling],
+                                          help='recrawl a finished crawl')
+    parser_update.set_defaults(function=crawly_update)
+
+    parser_fedlex = subparsers.add_parser('fedlex', parents=[base, transport],
+                                          help='crawl all laws in force from fedlex')
+    parser_fedlex.add_argument('--reset_counter', type=int, default=-1)
+    parser_fedlex.add_argument('--delta', action='store_true',
+                               help='only crawl the laws that changed since the last --delta run')
+    parser_fedlex.set_defaults(function=crawly_fedlex)
+
+    parser_stats = subparsers.add_parser('stats', parents=[base],
+                                         help='print the crawl state summary')
+    parser_stats.add_argument('--full', action='store_true')
+    parser_stats.set_defaults(function=crawly_stats)
 
-    scraper.crawl_page(
-        write_dir=args.write_dir, 
-        write=args.write,
-        verbose=args.verbose, 
-        filter_function=args.filter_function, 
-        filter_string=args.filter_string, 
-        begin=args.begin,
-    )
+    parser_export = subparsers.add_parser('export', parents=[base],
+                                          help='export the knowledge base')
+    parser_export.add_argument('--formats', type=str, default='jsonl,parquet')
+    parser_export.add_argument('--name', type=str, default='knowledge_base_full')
+    parser_export.set_defaults(function=crawly_export)
 
-    with open(os.path.join(args.write_dir, 'overview', 'scraper_class.pkl'), 'wb') as con:
-        pickle.dump(scraper, con)
+    return parser
 
 
 if __name__ == "__main__":
-    # add parser
-    parser = argparse.ArgumentParser(description='Arguments')
-
-    parser.add_argument("--write_dir",
-                        type=str)
-    parser.add_argument("--write",
-                        type=bool,
-                        default=True)
-    parser.add_argument('--verbose',
-                        type=bool,
-                        default=True)
-    parser.add_argument('--filter_function',
-                        type=function,
-                        default=string_filter)
-    parser.add_argument('--filter_string',
-                        type=str,
-                        default='astra/de|classified-compilation|fedlex')
-    parser.add_argument('--begin', type=bool, default=False)
-
-
-    args = parser.parse_args()
-
-    crawly_go_crawl(args)
\ No newline at end of file
+    args = build_parser().parse_args()
+    args.function(args)
@@ -1,22 +1,233 @@
 import re
-from SPARQLWrapper import SPARQLWrapper2
+import sys
+import json
 
-def extract_entries(sparql_query):
-    parsed_queryset = []
-    full_set = sparql_query[sparql_query.variables]
-    for entry in full_set:
-        sub_set = {}
-        for key_, val_ in entry.items():
-            val_raw = val_.value
-            val_raw = re.sub('\xa0', '', val_raw)
-            sub_set[key_] = val_raw
+from ..utils.transport import HttpTransport
 
-        parsed_queryset.append(sub_set)
+FEDLEX_ENDPOINT = 'https://fedlex.data.admin.ch/sparqlendpoint'
 
-    return parsed_queryset
 
-def fetch_full_fedlex(sparql_ep='https://fedlex.data.admin.ch/sparqlendpoint'):
-    fetcher = SPARQLWrapper2(sparql_ep)
+def decode_binding(binding, keys):
+    """
+    Decode a single binding of a SPARQL JSON result into a flat dict of
+    values (non breaking spaces removed).
+
+    Parameters:
+    binding (dict): One entry of results.bindings.
+    keys (dict): Cache of interned variable names, shared across rows.
+
+    Returns:
+    dict: variable -> value
+    """
+    row = {}
+    for key_, val_ in binding.items():
+        key_ = keys.setdefault(key_, sys.intern(key_))
+        row[key_] = val_['value'].replace('\xa0', '')
+    return row
+
+
+def iter_bindings(chunks):
+    """
+    Incrementally parse the bindings of a SPARQL JSON result. Only the
+    current binding is decoded at a time, the full response is never held
+    in memory.
+
+    Parameters:
+    chunks (iterable): Text chunks of the response body.
+
+    Returns:
+    generator: The raw bindings (dicts).
+    """
+    decoder = json.JSONDecoder()
+    start_pattern = re.compile(r'"bindings"\s*:\s*\[')
+    chunks = iter(chunks)
+    buffer = ''
+    position = None
+
+    def _more():
+        for chunk in chunks:
+            if chunk:
+                return chunk
+        raise ValueError('unexpected end of the SPARQL result')
+
+    # find the start of the bindings array
+    while position is None:
+        buffer += _more()
+        found = start_pattern.search(buffer)
+        if found:
+            position = found.end()
+
+    while True:
+        # skip separators
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position < len(buffer):
+                break
+            buffer = _more()
+            position = 0
+
+        if buffer[position] == ']':
+            return
+
+        try:
+            binding, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            buffer = buffer[position:] + _more()
+            position = 0
+            continue
+
+        yield binding
+        position = end
+        # drop what was decoded already
+        if position > 65536:
+            buffer = buffer[position:]
+            position = 0
+
+
+class SparqlClient:
+    """
+    Reusable client for a SPARQL endpoint. Keeps one HTTP session open and
+    streams the JSON results, rows are decoded lazily. Requests go through
+    an HttpTransport, so results can be recorded and replayed.
+
+    Parameters:
+    sparql_ep (str): The endpoint (default is the fedlex endpoint).
+    timeout (float): Timeout per request in seconds (default is 120).
+    chunk_size (int): Size of the read chunks in bytes (default is 65536).
+    transport (HttpTransport): Transport to use (default is None, i.e. a
+        live one).
+
+    Examples:
+    >>> client = SparqlClient()
+    >>> for row in client.select_paged(query, order_by='?sr_uri'):
+    ...     print(row['sr_uri'])
+    """
+    def __init__(self, 
+                 sparql_ep=FEDLEX_ENDPOINT, 
+                 timeout=120, 
+                 chunk_size=65536,
+                 transport=None) -> None:
+        self.sparql_ep = sparql_ep
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        if transport is None:
+            transport = HttpTransport()
+        self.transport = transport
+        self.headers = {'Accept': 'application/sparql-results+json'}
+
+    def select(self, query):
+        """
+        Run a SELECT query and lazily yield the decoded rows.
+        """
+        response = self.transport.get(self.sparql_ep,
+                                      params={'query': query},
+                                      headers=self.headers,
+                                      stream=True,
+                                      timeout=self.timeout)
+        with response:
+            response.raise_for_status()
+            response.encoding = 'utf-8'
+            keys = {}
+            chunks = response.iter_content(chunk_size=self.chunk_size,
+                                           decode_unicode=True)
+            for binding in iter_bindings(chunks):
+                yield decode_binding(binding, keys)
+
+    def select_paged(self, 
+                     query, 
+                     page_size=1000, 
+                     order_by=None, 
+                     keyset_var=None):
+        """
+        Run a SELECT query page by page and lazily yield the decoded rows,
+        the next page is only requested once the current one is consumed.
+
+        Pagination is done either with LIMIT/OFFSET (order_by should be
+        given, otherwise the pages are not stable) or with a keyset on
+        keyset_var. For keyset pagination the query needs a __KEYSET__
+        placeholder inside the WHERE clause, it is replaced by a filter on
+        the last value of the previous page.
+
+        Parameters:
+        query (str): The SELECT query (without ORDER BY/LIMIT/OFFSET).
+        page_size (int): Rows per page (default is 1000).
+        order_by (str): Sort expression, e.g. '?sr_uri' (default is None).
+        keyset_var (str): Variable used for keyset pagination, e.g.
+            'sr_uri' (default is None).
+
+        Returns:
+        generator: The decoded rows.
+        """
+        if keyset_var is not None:
+            yield from self._select_keyset(query, page_size, keyset_var)
+            return
+
+        offset = 0
+        while True:
+            page_query = query
+            if order_by is not None:
+                page_query += f'\nORDER BY {order_by}'
+            page_query += f'\nLIMIT {page_size}\nOFFSET {offset}'
+
+            n_rows = 0
+            for row in self.select(page_query):
+                n_rows += 1
+                yield row
+
+            if n_rows < page_size:
+                return
+            offset += page_size
+
+    def _select_keyset(self, query, page_size, keyset_var):
+        """
+        Keyset pagination, see select_paged. A key can span several rows, so
+        the rows of the last key of a full page are held back and the next
+        page starts after the key before it.
+        """
+        after_key = None
+        while True:
+            if after_key is None:
+                key_filter = ''
+            else:
+                escaped = after_key.replace('\\', '\\\\').replace('"', '\\"')
+                key_filter = f'FILTER( STR(?{keyset_var}) > "{escaped}" )'
+            page_query = query.replace('__KEYSET__', key_filter)
+            page_query += f'\nORDER BY STR(?{keyset_var})\nLIMIT {page_size}'
+
+            n_rows = 0
+            previous_key = None
+            current_key = None
+            pending = []
+            for row in self.select(page_query):
+                n_rows += 1
+                if row[keyset_var] != current_key:
+                    yield from pending
+                    pending = []
+                    previous_key = current_key
+                    current_key = row[keyset_var]
+                pending.append(row)
+
+            if n_rows < page_size:
+                yield from pending
+                return
+            if previous_key is None:
+                raise ValueError(f'more than {page_size} rows for {current_key},\
+                                 increase the page_size')
+            after_key = previous_key
+
+
+def iter_full_fedlex(client=None, page_size=1000):
+    """
+    Lazily yield all laws in force (sr_number, titel, abbreviation, sr_uri),
+    page by page.
+
+    Parameters:
+    client (SparqlClient): Client to use (default is None, i.e. a new one).
+    page_size (int): Rows per page (default is 1000).
+    """
+    if client is None:
+        client = SparqlClient()
     fetch_string = """
     PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
     PREFIX jolux: <http://data.legilux.public.lu/resource/ontology/jolux#>
@@ -38,17 +249,113 @@ def fetch_full_fedlex(sparql_ep='https://fedlex.data.admin.ch/sparqlendpoint'):
         FILTER( ( xsd:date(?datumInKraft) <= xsd:date(now()) ) )
         OPTIONAL { ?sr_uri jolux:dateNoLongerInForce ?datumAufhebung . }
         FILTER( !bound(?datumAufhebung) || xsd:date(?datumAufhebung) >= xsd:date(now()) )
+        __KEYSET__
     }
     """
-    fetcher.setQuery(fetch_string)
-    returner = fetcher.query()
-    extracted = extract_entries(returner)
+    yield from client.select_paged(fetch_string,
+                                   page_size=page_size,
+                                   keyset_var='sr_uri')
 
-    return extracted
+def fetch_full_fedlex(sparql_ep=FEDLEX_ENDPOINT, client=None):
+    """
+    All laws in force as a list of dicts, see iter_full_fedlex
+    """
+    if client is None:
+        client = SparqlClient(sparql_ep)
+    return list(iter_full_fedlex(client=client))
+
+def iter_fedlex_versions(since=None, client=None, page_size=1000):
+    """
+    Lazily yield all laws in force with the uri and applicability date of
+    their current consolidation (sr_number, titel, abbreviation, sr_uri,
+    consolidation, date_applicability).
+
+    Parameters:
+    since (str): Only laws whose current consolidation became applicable or
+        that entered into force on or after this date (YYYY-MM-DD)
+        (default is None, i.e. all laws).
+    client (SparqlClient): Client to use (default is None, i.e. a new one).
+    page_size (int): Rows per page (default is 1000).
+    """
+    if client is None:
+        client = SparqlClient()
+    raw_string = """
+    PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+    PREFIX jolux: <http://data.legilux.public.lu/resource/ontology/jolux#>
+    PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
+
+    SELECT DISTINCT ?sr_number ?titel ?abbreviation ?sr_uri ?consolidation ?date_applicability WHERE {
+        {
+            SELECT ?sr_uri (MAX(?dateApplicability) AS ?date_applicability) WHERE {
+                ?sr_uri rdf:type jolux:ConsolidationAbstract .
+                ?sr_uri jolux:dateEntryInForce ?datumInKraft .
+                FILTER( ( xsd:date(?datumInKraft) <= xsd:date(now()) ) )
+                OPTIONAL { ?sr_uri jolux:dateNoLongerInForce ?datumAufhebung . }
+                FILTER( !bound(?datumAufhebung) || xsd:date(?datumAufhebung) >= xsd:date(now()) )
+
+                ?Consolidation jolux:isMemberOf ?sr_uri ;
+                               jolux:dateApplicability ?dateApplicability .
+                FILTER( xsd:date(?dateApplicability) <= xsd:date(now()) )
+            } GROUP BY ?sr_uri
+        }
+        ?consolidation jolux:isMemberOf ?sr_uri ;
+                       jolux:dateApplicability ?date_applicability .
+
+        ?sr_uri jolux:classifiedByTaxonomyEntry ?TaxonomyEntry ;
+                jolux:isRealizedBy ?Expression ;
+                jolux:dateEntryInForce ?datumInKraft .
+        ?TaxonomyEntry skos:notation ?sr_number .
+        ?Expression jolux:language <http://publications.europa.eu/resource/authority/language/DEU> .
+        ?Expression jolux:title ?titel ;
+                    jolux:titleShort ?abbreviation .
+        __SINCE__
+        __KEYSET__
+    }
+    """
+    if since is None:
+        since_filter = ''
+    else:
+        since_filter = f'''FILTER( xsd:date(?date_applicability) >= xsd:date("{since}") ||
+                xsd:date(?datumInKraft) >= xsd:date("{since}") )'''
+    fetch_string = raw_string.replace('__SINCE__', since_filter)
+
+    yield from client.select_paged(fetch_string,
+                                   page_size=page_size,
+                                   keyset_var='sr_uri')
+
+def iter_fedlex_in_force(client=None, page_size=10000):
+    """
+    Lazily yield the uris of all laws in force (dicts with the key sr_uri),
+    a cheap listing to find repealed laws by comparison.
+
+    Parameters:
+    client (SparqlClient): Client to use (default is None, i.e. a new one).
+    page_size (int): Rows per page (default is 10000).
+    """
+    if client is None:
+        client = SparqlClient()
+    fetch_string = """
+    PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+    PREFIX jolux: <http://data.legilux.public.lu/resource/ontology/jolux#>
+
+    SELECT DISTINCT ?sr_uri WHERE {
+        ?sr_uri rdf:type jolux:ConsolidationAbstract ;
+                jolux:dateEntryInForce ?datumInKraft .
+        FILTER( ( xsd:date(?datumInKraft) <= xsd:date(now()) ) )
+        OPTIONAL { ?sr_uri jolux:dateNoLongerInForce ?datumAufhebung . }
+        FILTER( !bound(?datumAufhebung) || xsd:date(?datumAufhebung) >= xsd:date(now()) )
+        __KEYSET__
+    }
+    """
+    yield from client.select_paged(fetch_string,
+                                   page_size=page_size,
+                                   keyset_var='sr_uri')
 
 def fetch_cited_by_art(article_uri, 
-                       sparql_ep='https://fedlex.data.admin.ch/sparqlendpoint'):
-    fetcher = SPARQLWrapper2(sparql_ep)
+                       sparql_ep=FEDLEX_ENDPOINT,
+                       client=None):
+    if client is None:
+        client = SparqlClient(sparql_ep)
     raw_string = """
     PREFIX jolux: <http://data.legilux.public.lu/resource/ontology/jolux#>
     PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
@@ -81,15 +388,13 @@ def fetch_cited_by_art(article_uri,
     """
     fetch_string = re.sub('__REPLACER__', article_uri, raw_string)
 
-    fetcher.setQuery(fetch_string)
-    returner = fetcher.query()
-    extracted = extract_entries(returner)
-
-    return extracted
+    return list(client.select(fetch_string))
 
 def fetch_citing_art(article_uri, 
-                     sparql_ep='https://fedlex.data.admin.ch/sparqlendpoint'):
-    fetcher = SPARQLWrapper2(sparql_ep)
+                     sparql_ep=FEDLEX_ENDPOINT,
+                     client=None):
+    if client is None:
+        client = SparqlClient(sparql_ep)
     raw_string = """
     PREFIX jolux: <http://data.legilux.public.lu/resource/ontology/jolux#>
     PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
@@ -119,9 +424,5 @@ def fetch_citing_art(article_uri,
     """
     fetch_string = re.sub('__REPLACER__', article_uri, raw_string)
     
-    fetcher.setQuery(fetch_string)
-    returner = fetcher.query()
-    extracted = extract_entries(returner)
-
-    return extracted
+    return list(client.select(fetch_string))
 
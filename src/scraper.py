@@ -2,11 +2,11 @@
 Combiner module for the scraper
 """
 import os
+import json
 import time
 import pickle
+import datetime
 
-import requests
-import hashlib
 from urllib.parse import unquote
 
 import re
@@ -16,8 +16,23 @@ from typing import Optional, Callable
 
 from .utils.adminlink import isolate_simple
 from .utils.adminlink import detect_javascript
-from .legal.helpers import isolate_legal_xml
-from .legal.sparqlqueries import fetch_full_fedlex, fetch_citing_art, fetch_cited_by_art
+from .utils.crawlstate import CrawlState, KnowledgeBaseView, TODO, DONE
+from .utils.scheduler import CrawlScheduler
+from .utils.admission import FETCH, DEFER, UNCHANGED
+from .utils.transport import HttpTransport
+from .utils.fingerprint import fingerprint, hamming_distance
+from .legal.sparqlqueries import SparqlClient, fetch_full_fedlex, iter_full_fedlex
+from .legal.sparqlqueries import fetch_citing_art, fetch_cited_by_art
+from .legal.sparqlqueries import iter_fedlex_versions, iter_fedlex_in_force
+
+
+def isolate_legal_xml(url):
+    """
+    Wrapper around legal.helpers.isolate_legal_xml, selenium is only
+    imported once a javascript (fedlex) page is actually crawled
+    """
+    from .legal.helpers import isolate_legal_xml as _isolate_legal_xml
+    return _isolate_legal_xml(url)
 
 class AstraScraper:
     """
@@ -25,14 +40,74 @@ class AstraScraper:
     this is a safeguard that can later on be changed manually if need be (you might need) this
     if there is a timeout because you get blocked due to too many requests:) 
 
+    The crawl state (urls, frontier and knowledge base) is kept in a compact
+    CrawlState. Pass a memory_budget (in bytes) to spill older knowledge base
+    records to disk, by default they are spilled to write_dir/_overview.
+    The visit order and the crawl budgets are set by a CrawlScheduler. If an
+    AdmissionControl is given, urls are probed with HEAD requests before they
+    are downloaded (skip unwanted or unchanged files, defer large ones).
+    All requests go through an HttpTransport, which can record a crawl and
+    replay it offline. Pages whose main content did not change since the
+    version on disk (same raw bytes or same content fingerprint) are not
+    written again. simhash_distance > 0 also treats pages whose SimHash is
+    within that many bits as unchanged; this is lossy, real edits (e.g. a
+    single word) can stay within a few bits, so it is off by default.
+
     Examples:
     >>> astra_scraper = AstraScraper()
     >>> astra_scraper.crawl_page(write_dir='my_write_dir')    
+    >>> astra_scraper.state.memory_report()
+
+    A saved crawl can be continued (or recrawled) with restore_state:
+    >>> astra_scraper.restore_state('my_write_dir', CrawlState.load(state_path))
+    >>> astra_scraper.crawl_page(write_dir='my_write_dir', begin=False)
     """
-    def __init__(self) -> None:
-        self.knowledge_base = {}
+    def __init__(self, 
+                 memory_budget=None, 
+                 spill_dir=None, 
+                 scheduler=None, 
+                 admission=None,
+                 transport=None,
+                 simhash_distance=0) -> None:
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        if scheduler is None:
+            scheduler = CrawlScheduler()
+        self.scheduler = scheduler
+        if transport is None:
+            transport = HttpTransport()
+        self.transport = transport
+        if admission is not None and admission.transport is None:
+            admission.transport = transport
+        self.admission = admission
+        self.simhash_distance = simhash_distance
+        self.n_unchanged = 0
+        self.n_popped = 0
+        self.exporter = None
+        self.state = CrawlState()
         self.error_iterator = 0
 
+    @property
+    def knowledge_base(self):
+        return KnowledgeBaseView(self.state)
+
+    @property
+    def link_dict(self):
+        return list(self.state.urls)
+
+    @link_dict.setter
+    def link_dict(self, url_list):
+        for url in url_list:
+            self.state.intern(url)
+
+    @property
+    def todo_links(self):
+        return list(self.state.iter_status(TODO))
+
+    @property
+    def done_links(self):
+        return list(self.state.iter_status(DONE))
+
     def crawl_page(self, 
                    write_dir, 
                    initial_url='https://www.astra.admin.ch/astra/de/home.html',
@@ -42,8 +117,40 @@ class AstraScraper:
                    verbose=True,
                    begin=True,
                    retries=1,
+                   exporter=None,
                    **kwargs,
                    ):
+        """
+        Crawl the page starting from initial_url. If an exporter (a
+        RecordExporter with KNOWLEDGE_BASE_FIELDS) is given, every knowledge
+        base record is streamed to it while crawling.
+        """
+        self.domain_url = domain_url
+        self.scheduler.reset()
+        self.exporter = exporter
+        try:
+            self._crawl(write_dir=write_dir,
+                        initial_url=initial_url,
+                        predefined=predefined,
+                        write=write,
+                        verbose=verbose,
+                        begin=begin,
+                        retries=retries,
+                        **kwargs)
+        finally:
+            if self.exporter is not None:
+                self.exporter.flush()
+            self.exporter = None
+
+    def _crawl(self,
+               write_dir,
+               initial_url,
+               predefined,
+               write,
+               verbose,
+               begin,
+               retries,
+               **kwargs):
         if begin:
             # set write dir
             self.write_dir = write_dir
@@ -51,7 +158,7 @@ class AstraScraper:
             if not predefined:
                 self._setup_crawling()
             else:
-                if not hasattr(self, 'link_dict'):
+                if not len(self.state):
                     raise AttributeError('A link dictionary needs to be\
                                         defined if using predefined=True')
                 
@@ -60,20 +167,33 @@ class AstraScraper:
                             write_status=write, 
                             verbose=verbose, 
                             **kwargs)
+            self.state.mark_done(initial_url)
         
-        while len(self.todo_links) > 0:
+        while self.state.n_todo > 0:
+            if self.scheduler.exhausted():
+                if verbose:
+                    print('crawl budget exhausted, stopping')
+                break
+
             current_try=0
-            current_url = next(iter(self.todo_links))
+            current_url = self.state.peek()
+            pull_url = self._pull_url(current_url)
+            depth = self.state.depth_of(current_url)
+
+            # skip (but keep for a later run) if the type budget is used up
+            category = self.write_split[self._get_filetype(pull_url)]
+            if not self.scheduler.admit(category):
+                self.state.skip(current_url)
+                continue
 
-            if not domain_url in current_url and not 'classified-compilation' in current_url and not 'fedlex' in current_url:
-                pull_url = domain_url + current_url
-            else:
-                pull_url = current_url
+            if not self._admit(current_url, pull_url, category, verbose):
+                continue
 
             try:
                 self._process_page(url=pull_url, 
                                 write_status=write, 
                                 verbose=verbose, 
+                                depth=depth,
                                 **kwargs)
             except:
                 # Most of the time there is just an issue with the website
@@ -85,9 +205,28 @@ class AstraScraper:
                     self._process_page(url=pull_url, 
                                     write_status=write, 
                                     verbose=verbose, 
+                                    depth=depth,
                                     **kwargs)
             self._pop_item(current_url)
 
+    def restore_state(self, write_dir, state):
+        """
+        Continue from a saved CrawlState (instead of _setup_crawling)
+
+        Parameters:
+        write_dir (str): The write dir of the saved crawl.
+        state (CrawlState): The loaded state.
+        """
+        self.write_dir = write_dir
+        self.state = state
+        self.internal_list = []
+        self.error_list = []
+        self._setup_write()
+
+    def state_path(self):
+        """Where the crawl state is checkpointed"""
+        return os.path.join(self.write_dir, '_overview', 'crawl_state.pkl')
+
     def update_data(self, 
                     knowledge_base):
         pass
@@ -96,24 +235,39 @@ class AstraScraper:
                       url, 
                       write_status, 
                       verbose, 
+                      depth=0,
                       **kwargs):
         as_pickle = False
         # crawl page 
-        crawl_object = requests.get(url)
+        crawl_object = self.transport.get(url)
+        n_bytes = len(crawl_object.content)
+        response_headers = crawl_object.headers
         file_type, file_name = self._get_filenames(url)
 
+        raw_content = crawl_object.content
+
         # if html parse and get new links
         if file_type in ['html']:
             as_pickle=True
-            crawl_object, file_type, file_name, linked_docs = self._process_html(url=url, 
+            crawl_object, file_type, file_name, linked_docs, raw_content = self._process_html(url=url, 
                                                                         crawl_object=crawl_object,
                                                                         file_name=file_name, 
+                                                                        depth=depth,
                                                                         **kwargs)
         else:
             linked_docs = []
 
-        hash_value = self._hash_file(crawl_object)
-        # Store according to type
+        # fingerprints are computed once per fetch
+        hash_value, content_hash, simhash, numbers_hash = fingerprint(raw_content, 
+                                                                      crawl_object, 
+                                                                      remove_boilerplate=file_type == 'html')
+        changed = self._is_changed(url, hash_value, content_hash, simhash, numbers_hash)
+        if not changed:
+            self.n_unchanged += 1
+            if verbose:
+                print(f'unchanged: {url}')
+
+        # Store according to type (unchanged pages are not written again)
         self._store_object(url=url, 
                            object=crawl_object, 
                            file_name=file_name, 
@@ -122,7 +276,18 @@ class AstraScraper:
                            neighbour_list=linked_docs, 
                            write=write_status, 
                            as_pickle=as_pickle,
+                           content_hash=content_hash,
+                           simhash=simhash,
+                           numbers_hash=numbers_hash,
+                           etag=response_headers.get('ETag'),
+                           last_modified=response_headers.get('Last-Modified'),
+                           changed=changed,
                            )
+        # free the parse tree right away, it is not needed after storing
+        if isinstance(crawl_object, BeautifulSoup):
+            crawl_object.decompose()
+
+        self.scheduler.record_fetch(url, self.write_split[file_type], n_bytes)
 
         if verbose:
             print(f'processed: {url}')
@@ -130,8 +295,11 @@ class AstraScraper:
         
 
     def _setup_crawling(self):
-        self.link_dict = {}
-        self.done_links = []
+        spill_dir = self.spill_dir
+        if spill_dir is None:
+            spill_dir = os.path.join(self.write_dir, '_overview')
+        self.state = CrawlState(memory_budget=self.memory_budget,
+                                spill_dir=spill_dir)
         self.internal_list = [] 
         self.error_list = []
 
@@ -178,51 +346,49 @@ class AstraScraper:
     def _gather_links(self,
                       soup_obj: BeautifulSoup,
                       filter_function: Optional[Callable] = None,
-                      filter_string: Optional[str] = None):
+                      filter_string: Optional[str] = None,
+                      depth: int = 1):
         """
-        Gather links from the soup object.
+        Gather links from the soup object (as absolute urls) and put the new
+        ones on the frontier (ordered by the scheduler).
 
         Parameters:
 
         soup_obj (BeautifulSoup): The BeautifulSoup object.
         filter (Callable): A function to filter URLs (default is None).
         filter_string (str): A string to filter URLs (default is None).
+        depth (int): Link depth of the gathered links (default is 1).
         """
 
         new_list = isolate_simple(soup_obj,
                                   filter_function=filter_function,
                                   search_string=filter_string)
+        # relative and absolute links to the same page are one url
+        new_list = [self._pull_url(link) for link in new_list]
 
-        if self.link_dict:
-            set_new = set(new_list)
-            set_existing = set(self.link_dict)
-
-            crawl_new = list(set_new - set_existing)
-            self.todo_links = crawl_new + self.todo_links
-            self.todo_links = list(set(self.todo_links)  - set(self.done_links))
-
-            self.link_dict = self.link_dict + crawl_new
-        else:
-            self.link_dict = new_list
-            self.todo_links = new_list
+        self.state.add_links(new_list,
+                             depth=depth,
+                             priority_function=self._link_priority)
 
         return new_list
     
-    def _process_html(self, url, crawl_object, file_name, **kwargs):
+    def _process_html(self, url, crawl_object, file_name, depth=0, **kwargs):
         """
         Utility function that checks whether a page can be crawled using 
         requests or whether there is javascript embedded (which needs selenium)
 
         Parameters:
         url (str): the url to be crawled (needed if forwarding is needed)
-        crawl_object (): the object returned from requests.get
+        crawl_object (): the object returned from transport.get
         file_name (str): object name to save (used as passforward)
+        depth (int): link depth of the url
 
         returns:
         parsed_data (bs4): beautifulsoup object
         file_type (str from list): type of object crawled
         file_name (str): file name for saving (and linking throughout)
         linked_docs (dict): docs that are linked on the current html (to be crawled)
+        raw_content (bytes): the raw content the beautifulsoup object was parsed from
 
         """
         soup = BeautifulSoup(crawl_object.content, 'html.parser')
@@ -230,10 +396,11 @@ class AstraScraper:
 
         # If javascript - then it is from fedlex
         if is_javascript:
-            new_page, legal_status = isolate_legal_xml(url)
+            new_page, legal_status = self.transport.call('isolate_legal_xml', isolate_legal_xml, url)
             # reperform crawling
-            crawl_object = requests.get(new_page)
+            crawl_object = self.transport.get(new_page)
             soup = BeautifulSoup(crawl_object.content, 'xml')
+            raw_content = crawl_object.content
             try:
                 for name_item in soup.find_all('FRBRname'):
                     if name_item['xml:lang'] == 'de':
@@ -253,12 +420,13 @@ class AstraScraper:
         else:
             file_type = 'html'
             file_name = file_name
+            raw_content = crawl_object.content
             # Gather new links
-            linked_docs = self._gather_links(soup, **kwargs)
+            linked_docs = self._gather_links(soup, depth=depth + 1, **kwargs)
         
         parsed_data = self._parse_site(soup, file_type)
         
-        return parsed_data, file_type, file_name, linked_docs
+        return parsed_data, file_type, file_name, linked_docs, raw_content
 
 
     def _parse_site(self, soup_obj, file_type):
@@ -269,20 +437,25 @@ class AstraScraper:
                   url: str,
                   writing_steps: Optional[int] = 400):
         """
-        Pop the current item from the todo links.
+        Pop the current item from the todo links, the crawl state is
+        checkpointed every writing_steps popped items.
 
         Parameters:
         url (str): The URL to pop.
-        verbose (bool): If True, print a message (default is True).
+        writing_steps (int): Items between two checkpoints (default is 400).
         """
-        self.done_links.append(url)
-        self.todo_links = list(set(self.todo_links)  - set(self.done_links))
-        self.link_dict = list(set(self.link_dict))
+        self.state.mark_done(url)
+        self.n_popped += 1
         
-        if len(self.link_dict) % writing_steps == 0:
-            print(len(self.link_dict))
+        if self.n_popped % writing_steps == 0:
+            print(len(self.state))
+            # the checkpoint marks these pages as done, so their records
+            # have to be exported before it is written
+            if self.exporter is not None:
+                self.exporter.flush()
             with open(os.path.join(self.write_dir, '_overview', 'link_dict.pkl'), 'wb') as con:
                 pickle.dump(self.link_dict, con)
+            self.state.save(self.state_path())
 
     def _get_filenames(self, 
                        url,):
@@ -304,16 +477,92 @@ class AstraScraper:
         else:
             return file_type, file_name
 
-    def _hash_file(self, response_object):
-        if type(response_object) == requests.models.Response:
-            hash_object = hashlib.md5(response_object.content).hexdigest()
-        elif type(response_object) == BeautifulSoup:
-            hash_object = hashlib.md5(response_object.text.encode('utf-8')).hexdigest()
+    def _admit(self, current_url, pull_url, category, verbose):
+        """
+        Ask the admission control whether the url should be fetched now,
+        skipped, deferred or left alone because it did not change. Deferred
+        urls are fetched when they come up again.
+
+        returns:
+        bool: True if the url should be fetched now
+        """
+        if self.admission is None or self.state.is_deferred(current_url):
+            return True
+
+        decision = self.admission.decide(pull_url,
+                                         category,
+                                         self.state.get_validators(pull_url))
+        if decision == FETCH:
+            return True
+
+        if decision == DEFER:
+            self.state.defer(current_url, self.scheduler.defer_offset)
+        elif decision == UNCHANGED:
+            self._pop_item(current_url)
         else:
-            print('issue found')
-            hash_object = '__error__'
-        return hash_object
-    
+            self.state.skip(current_url)
+
+        if verbose:
+            print(f'{decision}: {pull_url}')
+        return False
+
+    def _get_filetype(self, url):
+        """
+        File type of a url (without raising on urls that have no file name)
+        """
+        try:
+            file_type, _ = self._get_filenames(url)
+        except TypeError:
+            file_type = 'else'
+        return file_type
+
+    def _pull_url(self, url):
+        """
+        Absolute url for a (possibly relative) link
+        """
+        if not self.domain_url in url and not 'classified-compilation' in url and not 'fedlex' in url:
+            return self.domain_url + url
+        return url
+
+    def _link_priority(self, url, depth):
+        """
+        Priority of a newly found link, see CrawlScheduler.priority
+        """
+        pull_url = self._pull_url(url)
+        return self.scheduler.priority(url=pull_url,
+                                       depth=depth,
+                                       file_type=self._get_filetype(pull_url),
+                                       change_rate=self.state.change_rate(pull_url))
+
+    def _is_changed(self, url, hex_hash, content_hash, simhash, numbers_hash=None):
+        """
+        Compare the fingerprints of a fetch with the last written version of
+        the url.
+        Only the main content counts for parsed pages, so changes in the
+        navigation, footer or a "last changed" stamp do not count as a change.
+
+        returns:
+        bool: True if the url is new or its content changed
+        """
+        url_id = self.state.url_ids.get(url)
+        if url_id is None:
+            return True
+        old_record = self.state.get_record(url_id)
+        if old_record is None:
+            return True
+        if old_record.file_hash == hex_hash:
+            return False
+        if content_hash is None or old_record.content_hash is None:
+            return True
+        if old_record.content_hash == content_hash:
+            return False
+        if not self.simhash_distance:
+            return True
+        # changed dates or numbers are never a near duplicate
+        if old_record.numbers_hash is not None and old_record.numbers_hash != numbers_hash:
+            return True
+        return hamming_distance(old_record.simhash, simhash) > self.simhash_distance
+
     def _store_object(self,
                       url, 
                       object, 
@@ -322,17 +571,40 @@ class AstraScraper:
                       hex_hash,
                       neighbour_list,
                       write=False,
-                      as_pickle=False):
+                      as_pickle=False,
+                      content_hash=None,
+                      simhash=None,
+                      numbers_hash=None,
+                      etag=None,
+                      last_modified=None,
+                      changed=True):
         
         # prepare write path
         write_end_split = self.write_split[file_type]
         write_path = os.path.join(self.write_dir, write_end_split, file_name)
 
         # store relevant stuff to overview object
-        self.knowledge_base[url] = {}
-        self.knowledge_base[url]['storage_location'] = write_path
-        self.knowledge_base[url]['file_hash'] = hex_hash
-        self.knowledge_base[url]['neighbour_list'] = neighbour_list
+        self.state.store(url=url,
+                         storage_location=write_path,
+                         file_hash=hex_hash,
+                         neighbour_list=neighbour_list,
+                         content_hash=content_hash,
+                         simhash=simhash,
+                         numbers_hash=numbers_hash,
+                         etag=etag,
+                         last_modified=last_modified,
+                         changed=changed)
+        if not changed:
+            # nothing to write or reprocess downstream
+            return
+
+        if self.exporter is not None:
+            self.exporter.write({'url': url,
+                                 'storage_location': write_path,
+                                 'file_hash': hex_hash,
+                                 'neighbour_list': neighbour_list,
+                                 'content_hash': content_hash,
+                                 'simhash': None if simhash is None else f'{simhash:016x}'})
 
         if write:
             # write object
@@ -352,52 +624,206 @@ class AstraScraper:
 class FedlexScraper:
     """
     scraper for the full set of fedlex, isolates the content but also makes use
-    of the sparql endpoint to isolate dependencies across legal articles
+    of the sparql endpoint to isolate dependencies across legal articles. Pass
+    an exporter (a RecordExporter with LEGAL_FIELDS) to _scrap_feldex to
+    persist the legal metadata including the citation lists.
+
+    The full set of uris is fetched page by page while crawling (so crawling
+    starts with the first page), use prefetch=True to fetch it on
+    initialization instead. All queries share one SparqlClient and all
+    requests go through one HttpTransport (see AstraScraper).
+
+    refresh only crawls the laws that changed since the last run.
+
+    Examples:
+    >>> fedlex_scraper = FedlexScraper()
+    >>> report = fedlex_scraper.refresh('my_write_dir/_overview/fedlex_versions.json')
     """
-    def __init__(self) -> None:
-        # fet full set of uris
-        self.full_set = fetch_full_fedlex()
+    def __init__(self, prefetch=False, client=None, transport=None) -> None:
+        if transport is None:
+            transport = HttpTransport()
+        self.transport = transport
+        if client is None:
+            client = SparqlClient(transport=transport)
+        self.client = client
+        self.full_set = None
+        if prefetch:
+            # fet full set of uris
+            self.full_set = fetch_full_fedlex(client=self.client)
         self.crawled_legal_knowledge = {}
 
-    def _scrap_feldex(self, id_counter=0, reset_counter=0):
-        for legal_entry in self.full_set:
-            # Set up feature to restart crawling if there is an error
-            # use the reset counter if necessary
-            if id_counter <= reset_counter:
-                id_counter += 1
+    def _iter_full_set(self):
+        """
+        Yield the full set of uris, streaming it from the endpoint on the
+        first call and from memory afterwards
+        """
+        if self.full_set is not None:
+            yield from self.full_set
+            return
+        full_set = []
+        for legal_entry in iter_full_fedlex(client=self.client):
+            full_set.append(legal_entry)
+            yield legal_entry
+        self.full_set = full_set
+
+    def refresh(self, 
+                versions_path, 
+                write_dir='data/01_raw/01_all/legal', 
+                exporter=None, 
+                save_steps=50,
+                overlap_days=30):
+        """
+        Incremental fedlex crawl. The consolidation and applicability date of
+        every crawled law are kept in versions_path (json). Only laws whose
+        current consolidation became applicable (or that entered into force)
+        since the last run are requested from the endpoint, and of those only
+        the ones with a new consolidation are crawled again (including their
+        citations). Without a versions file all laws in force are crawled.
+        The files are named after the sr_uri, see _legal_file_name.
+
+        Consolidations are often published after the date they apply from,
+        so the query starts overlap_days before the last run. Repealed laws
+        are found by comparing the known laws with the list of laws in force.
+
+        Parameters:
+        versions_path (str): The json file with the versions of the last run.
+        write_dir (str): Where the legal documents are stored.
+        exporter (RecordExporter): see _scrap_feldex (default is None).
+        save_steps (int): Save the versions every save_steps laws, so an
+            interrupted refresh continues where it stopped (default is 50).
+        overlap_days (int): Days before the last run the query starts at
+            (default is 30).
+
+        returns:
+        dict: The sr_uris of the 'added', 'amended' and 'repealed' laws
+        """
+        versions = self._load_versions(versions_path)
+        since = versions['last_run']
+        if since is not None:
+            since = (datetime.date.fromisoformat(since)
+                     - datetime.timedelta(days=overlap_days)).isoformat()
+        run_date = time.strftime('%Y-%m-%d')
+        laws = versions['laws']
+        report = {'added': [], 'amended': [], 'repealed': []}
+
+        seen = set()
+        for legal_entry in iter_fedlex_versions(since=since, client=self.client):
+            sr_uri = legal_entry['sr_uri']
+            # a law can have several rows (e.g. titles)
+            if sr_uri in seen:
                 continue
-            print(f"Crawling {legal_entry['titel']}")
-            web_string = legal_entry['sr_uri']
-            web_string = re.sub('fedlex.data.admin.ch',
-                                'www.fedlex.admin.ch',
-                                web_string)
-            web_string = web_string + '/de'
+            seen.add(sr_uri)
 
-            xml_url, in_force_status = isolate_legal_xml(web_string)
+            known = laws.get(sr_uri)
+            if known is not None and known['consolidation'] == legal_entry['consolidation']:
+                continue
+            if known is None:
+                report['added'].append(sr_uri)
+            else:
+                report['amended'].append(sr_uri)
+            file_name = self._legal_file_name(sr_uri)
 
-            crawl_object = requests.get(xml_url)
-            soup = BeautifulSoup(crawl_object.content, 'xml')
+            self._crawl_legal_entry(legal_entry, file_name, write_dir, exporter)
+            laws[sr_uri] = {'consolidation': legal_entry['consolidation'],
+                            'date_applicability': legal_entry['date_applicability'],
+                            'file_name': file_name}
 
-            # add some meta
-            try:
-                articles_citing_current = fetch_citing_art(legal_entry['sr_uri'])
-            except:
-                articles_citing_current = {}
-            try:
-                articles_cited_in_current = fetch_cited_by_art(legal_entry['sr_uri'])
-            except:
-                articles_cited_in_current = {}
+            if len(seen) % save_steps == 0:
+                self._save_versions(versions_path, versions)
 
-            legal_entry['citing_article'] = articles_citing_current
+        if since is not None:
+            in_force = {entry['sr_uri'] for entry in iter_fedlex_in_force(client=self.client)}
+            # an empty list means the query went wrong, not that all laws were repealed
+            if in_force:
+                for sr_uri in [sr_uri for sr_uri in laws if sr_uri not in in_force]:
+                    del laws[sr_uri]
+                    report['repealed'].append(sr_uri)
 
-            legal_entry['cited_in_article'] = articles_cited_in_current
+        versions['last_run'] = run_date
+        self._save_versions(versions_path, versions)
 
-            # save as pickle
-            with open(f'data/01_raw/01_all/legal/legal_doc_{id_counter}.pkl', 'wb') as con:
-                pickle.dump(soup, con)
-            
-            # add entry to knowledge base
-            self.crawled_legal_knowledge[f'legal_doc_{id_counter}.pkl'] = legal_entry
+        print(f"added: {len(report['added'])}, amended: {len(report['amended'])}, "
+              f"repealed: {len(report['repealed'])}")
+        return report
 
+    def _legal_file_name(self, sr_uri):
+        """
+        File name of a law crawled by refresh, derived from its sr_uri (e.g.
+        legal_eli_cc_1999_404.pkl), so it never collides with the numbered
+        legal_doc files of _scrap_feldex
+        """
+        path = re.sub(r'^https?://[^/]+/', '', sr_uri)
+        return 'legal_' + re.sub(r'[^\w.-]+', '_', path).strip('_') + '.pkl'
+
+    def _load_versions(self, versions_path):
+        if not os.path.exists(versions_path):
+            return {'last_run': None, 'laws': {}}
+        with open(versions_path, 'r') as con:
+            return json.load(con)
+
+    def _save_versions(self, versions_path, versions):
+        os.makedirs(os.path.dirname(versions_path) or '.', exist_ok=True)
+        tmp_path = versions_path + '.tmp'
+        with open(tmp_path, 'w') as con:
+            json.dump(versions, con)
+        os.replace(tmp_path, versions_path)
+
+    def _scrap_feldex(self, 
+                      id_counter=0, 
+                      reset_counter=0, 
+                      exporter=None, 
+                      write_dir='data/01_raw/01_all/legal'):
+        for legal_entry in self._iter_full_set():
+            # Set up feature to restart crawling if there is an error
+            # use the reset counter if necessary
+            if id_counter <= reset_counter:
+                id_counter += 1
+                continue
+            self._crawl_legal_entry(legal_entry, 
+                                    f'legal_doc_{id_counter}.pkl', 
+                                    write_dir, 
+                                    exporter)
             id_counter += 1
-            
\ No newline at end of file
+
+    def _crawl_legal_entry(self, legal_entry, file_name, write_dir, exporter=None):
+        """
+        Crawl a single law with its citations and store it as file_name
+        """
+        print(f"Crawling {legal_entry['titel']}")
+        web_string = legal_entry['sr_uri']
+        web_string = re.sub('fedlex.data.admin.ch',
+                            'www.fedlex.admin.ch',
+                            web_string)
+        web_string = web_string + '/de'
+
+        xml_url, in_force_status = self.transport.call('isolate_legal_xml', 
+                                                       isolate_legal_xml, 
+                                                       web_string)
+
+        crawl_object = self.transport.get(xml_url)
+        soup = BeautifulSoup(crawl_object.content, 'xml')
+
+        # add some meta
+        try:
+            articles_citing_current = fetch_citing_art(legal_entry['sr_uri'],
+                                                       client=self.client)
+        except:
+            articles_citing_current = {}
+        try:
+            articles_cited_in_current = fetch_cited_by_art(legal_entry['sr_uri'],
+                                                           client=self.client)
+        except:
+            articles_cited_in_current = {}
+
+        legal_entry['citing_article'] = articles_citing_current
+
+        legal_entry['cited_in_article'] = articles_cited_in_current
+
+        # save as pickle
+        with open(os.path.join(write_dir, file_name), 'wb') as con:
+            pickle.dump(soup, con)
+        
+        # add entry to knowledge base
+        self.crawled_legal_knowledge[file_name] = legal_entry
+        if exporter is not None:
+            exporter.write({'file_name': file_name, **legal_entry})
@@ -0,0 +1,155 @@
+"""
+Admission control: probe urls with HEAD (or a ranged GET) before downloading
+"""
+import re
+import requests
+
+from .transport import HttpTransport
+
+
+FETCH = 'fetch'
+SKIP = 'skip'
+DEFER = 'defer'
+UNCHANGED = 'unchanged'
+
+# Rules per write_split category, the keys of a rule are
+# probe (bool): probe the url at all (default is True)
+# action (str): FETCH, SKIP or DEFER for every url of the category
+# content_types (list): allowed Content-Type prefixes, others are skipped
+# max_bytes (int): maximal Content-Length
+# over_size (str): SKIP or DEFER if max_bytes is exceeded (default is DEFER)
+# skip_unchanged (bool): do not fetch if ETag/Last-Modified did not change
+#     since the last fetch (default is True)
+DEFAULT_ADMISSION_RULES = {
+    'html': {'probe': False},
+    'legal': {'probe': False},
+    'else': {'max_bytes': 50_000_000, 'over_size': SKIP},
+}
+
+
+class AdmissionControl:
+    """
+    Decides from the headers of a HEAD request (or a ranged GET if the server
+    does not support HEAD) whether a url is fetched, skipped, deferred to the
+    end of the frontier or left alone because it did not change.
+
+    Parameters:
+    rules (dict): Rules per write_split category, merged over
+        DEFAULT_ADMISSION_RULES (default is None).
+    timeout (float): Timeout of the probe requests in seconds (default is 10).
+    transport (HttpTransport): Transport for the probes (default is None,
+        i.e. the one of the scraper).
+
+    Examples:
+    >>> admission = AdmissionControl(rules={'cad': {'action': SKIP},
+    ...                                     'pdf': {'max_bytes': 20_000_000}})
+    >>> astra_scraper = AstraScraper(admission=admission)
+    """
+    def __init__(self, rules=None, timeout=10, transport=None) -> None:
+        self.rules = {key_: dict(val_) for key_, val_ in DEFAULT_ADMISSION_RULES.items()}
+        if rules is not None:
+            for category, rule in rules.items():
+                self.rules.setdefault(category, {}).update(rule)
+        self.timeout = timeout
+        self.transport = transport
+        self.n_probes = 0
+
+    def decide(self, url, category, validators=None):
+        """
+        Decide what to do with a url.
+
+        Parameters:
+        url (str): The url to check.
+        category (str): write_split category expected for the url.
+        validators (tuple): (etag, last_modified) of the last fetch, None if
+            the url was never fetched (default is None).
+
+        Returns:
+        str: One of FETCH, SKIP, DEFER or UNCHANGED.
+        """
+        rule = self.rules.get(category, {})
+        if 'action' in rule:
+            return rule['action']
+        if not rule.get('probe', True):
+            return FETCH
+
+        headers = self.probe(url)
+        if headers is None:
+            # probing failed, let the normal fetch deal with it
+            return FETCH
+
+        if rule.get('skip_unchanged', True) and validators is not None:
+            if self._unchanged(headers, validators):
+                return UNCHANGED
+
+        content_types = rule.get('content_types')
+        if content_types is not None:
+            content_type = headers.get('Content-Type', '')
+            if not any(content_type.startswith(type_) for type_ in content_types):
+                return SKIP
+
+        max_bytes = rule.get('max_bytes')
+        content_length = self.content_length(headers)
+        if max_bytes is not None and content_length is not None and content_length > max_bytes:
+            return rule.get('over_size', DEFER)
+
+        return FETCH
+
+    def probe(self, url):
+        """
+        Fetch the headers of a url, with a HEAD request or a ranged GET
+        (first byte only) if HEAD is not supported.
+
+        Returns:
+        requests.structures.CaseInsensitiveDict or None: The headers, None
+        if the url could not be probed.
+        """
+        self.n_probes += 1
+        if self.transport is None:
+            self.transport = HttpTransport()
+        try:
+            response = self.transport.head(url, allow_redirects=True, timeout=self.timeout)
+            if response.status_code < 400:
+                return response.headers
+
+            response = self.transport.get(url,
+                                          headers={'Range': 'bytes=0-0'},
+                                          stream=True,
+                                          allow_redirects=True,
+                                          timeout=self.timeout)
+            response.close()
+            if response.status_code < 400:
+                return response.headers
+        except (requests.RequestException, LookupError):
+            # LookupError: not recorded when replaying
+            pass
+        return None
+
+    @staticmethod
+    def content_length(headers):
+        """Total size in bytes from Content-Range or Content-Length (or None)"""
+        content_range = headers.get('Content-Range')
+        if content_range is not None:
+            total = re.search(r'/(\d+)$', content_range)
+            if total:
+                return int(total[1])
+        content_length = headers.get('Content-Length')
+        if content_length is not None and content_length.isdigit():
+            # a ranged GET reports the length of the range only
+            if content_range is None:
+                return int(content_length)
+        return None
+
+    @staticmethod
+    def validators(headers):
+        """(etag, last_modified) of a response"""
+        return headers.get('ETag'), headers.get('Last-Modified')
+
+    def _unchanged(self, headers, validators):
+        etag, last_modified = self.validators(headers)
+        old_etag, old_last_modified = validators
+        if etag is not None and old_etag is not None:
+            return etag == old_etag
+        if last_modified is not None and old_last_modified is not None:
+            return last_modified == old_last_modified
+        return False
@@ -0,0 +1,515 @@
+"""
+Compact, memory-bounded crawl state for the scraper
+"""
+import os
+import sys
+import json
+import time
+import pickle
+import shelve
+import heapq
+from array import array
+from collections.abc import Mapping
+
+
+# Status flags for every interned url (one byte per url)
+KNOWN = 0
+TODO = 1
+DONE = 2
+SKIPPED = 3
+
+MAX_DEPTH = 65535
+
+
+class CrawlRecord:
+    """
+    Compact knowledge base entry. Neighbours are stored as an array of
+    url ids instead of a list of strings. n_fetches and n_changes keep the
+    change history as counts (used to estimate the change frequency).
+    content_hash, simhash and numbers_hash fingerprint the main content of
+    parsed pages (None for binary files). etag and last_modified are the
+    validators of the last fetch (used by the admission control).
+    """
+    __slots__ = ('storage_location', 'file_hash', 'neighbour_ids',
+                 'n_fetches', 'n_changes', 'content_hash', 'simhash',
+                 'numbers_hash', 'etag', 'last_modified')
+
+    def __init__(self, storage_location, file_hash, neighbour_ids,
+                 n_fetches=1, n_changes=0, content_hash=None, simhash=None,
+                 numbers_hash=None, etag=None, last_modified=None):
+        self.storage_location = storage_location
+        self.file_hash = file_hash
+        self.neighbour_ids = neighbour_ids
+        self.n_fetches = n_fetches
+        self.n_changes = n_changes
+        self.content_hash = content_hash
+        self.simhash = simhash
+        self.numbers_hash = numbers_hash
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def __getstate__(self):
+        return (self.storage_location, self.file_hash, self.neighbour_ids,
+                self.n_fetches, self.n_changes, self.content_hash, self.simhash,
+                self.numbers_hash, self.etag, self.last_modified)
+
+    def __setstate__(self, state):
+        (self.storage_location, self.file_hash, self.neighbour_ids,
+         self.n_fetches, self.n_changes, self.content_hash, self.simhash,
+         self.numbers_hash, self.etag, self.last_modified) = state
+
+    def nbytes(self):
+        """Approximate size of the record in bytes"""
+        return (sys.getsizeof(self)
+                + sys.getsizeof(self.storage_location)
+                + sys.getsizeof(self.file_hash)
+                + sys.getsizeof(self.neighbour_ids)
+                + sys.getsizeof(self.content_hash)
+                + sys.getsizeof(self.simhash)
+                + sys.getsizeof(self.numbers_hash)
+                + sys.getsizeof(self.etag)
+                + sys.getsizeof(self.last_modified))
+
+
+class KnowledgeBaseView(Mapping):
+    """
+    Read only view that exposes the crawl state in the same layout as the
+    former knowledge base dictionary, i.e.
+
+    url: {'storage_location': ..., 'file_hash': ..., 'neighbour_list': [...]}
+    """
+    def __init__(self, state):
+        self._state = state
+
+    def __getitem__(self, url):
+        url_id = self._state.url_ids.get(url)
+        if url_id is None:
+            raise KeyError(url)
+        record = self._state.get_record(url_id)
+        if record is None:
+            raise KeyError(url)
+        return self._state.record_as_dict(record)
+
+    def __iter__(self):
+        for url_id in self._state.record_ids():
+            yield self._state.urls[url_id]
+
+    def __len__(self):
+        return self._state.n_records
+
+
+class CrawlState:
+    """
+    Holds everything the crawler needs to know about urls: the interned
+    url table, a status byte and the link depth per url, the frontier (a
+    heap ordered by priority, lower comes first) and the knowledge base
+    records. If a memory budget is given, the oldest records are spilled
+    to a shelve on disk once the in-memory records exceed the budget.
+
+    Parameters:
+    memory_budget (int): Maximal number of bytes kept in memory for
+        knowledge base records (default is None, i.e. unbounded).
+    spill_dir (str): Directory for the spill file, needed if a memory
+        budget is set (default is None).
+
+    Examples:
+    >>> state = CrawlState(memory_budget=50_000_000, spill_dir='tmp')
+    >>> state.add_links(['/astra/de/home.html'])
+    >>> state.memory_report()['bytes_per_url']
+    """
+    def __init__(self, memory_budget=None, spill_dir=None) -> None:
+        if memory_budget is not None and spill_dir is None:
+            raise ValueError('A spill_dir needs to be defined if using\
+                             a memory_budget')
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+
+        self.urls = []
+        self.url_ids = {}
+        self.status = bytearray()
+        self.depth = array('H')
+        self.frontier = []
+        self._seq = 0
+        self.n_todo = 0
+        self.n_done = 0
+        self.deferred_ids = set()
+
+        self.records = {}
+        self.record_bytes = 0
+        self.spilled_ids = set()
+        self._shelf = None
+
+    def __len__(self):
+        return len(self.urls)
+
+    def __contains__(self, url):
+        return url in self.url_ids
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self._shelf is not None:
+            self._shelf.sync()
+        state['_shelf'] = None
+        return state
+
+    # url table
+    def intern(self, url, depth=0):
+        """
+        Return the id of a url, registering it as known if it is new.
+        """
+        url_id = self.url_ids.get(url)
+        if url_id is None:
+            url = sys.intern(url)
+            url_id = len(self.urls)
+            self.urls.append(url)
+            self.url_ids[url] = url_id
+            self.status.append(KNOWN)
+            self.depth.append(min(depth, MAX_DEPTH))
+        return url_id
+
+    def depth_of(self, url):
+        """Link depth of a url (0 if the url is unknown)"""
+        url_id = self.url_ids.get(url)
+        if url_id is None:
+            return 0
+        return self.depth[url_id]
+
+    # frontier
+    def add_links(self, url_list, depth=0, priority_function=None):
+        """
+        Register a list of links, every link that was never seen before is
+        added to the frontier.
+
+        Parameters:
+        url_list (list): The links found on a page.
+        depth (int): Link depth of the new links (default is 0).
+        priority_function (Callable): Function taking (url, depth) and
+            returning the priority of a new link, or None if the link
+            should not be crawled (default is None, i.e. all links get
+            priority 0 and are crawled in the order they were found).
+
+        Returns:
+        list: The links that are new to the crawl.
+        """
+        new_links = []
+        for url in url_list:
+            if url in self.url_ids:
+                continue
+            url_id = self.intern(url, depth=depth)
+            if priority_function is None:
+                self.push(url_id)
+            else:
+                priority = priority_function(url, depth)
+                if priority is None:
+                    self.status[url_id] = SKIPPED
+                else:
+                    self.push(url_id, priority)
+            new_links.append(url)
+        return new_links
+
+    def push(self, url_id, priority=0.0):
+        """Put an already interned url on the frontier"""
+        if self.status[url_id] in (KNOWN, SKIPPED):
+            self.status[url_id] = TODO
+            self.n_todo += 1
+            self._seq += 1
+            heapq.heappush(self.frontier, (priority, self._seq, url_id))
+
+    def peek(self):
+        """
+        Return the next url to crawl (without removing it) or None if the
+        frontier is empty.
+        """
+        while self.frontier:
+            url_id = self.frontier[0][2]
+            if self.status[url_id] == TODO:
+                return self.urls[url_id]
+            heapq.heappop(self.frontier)
+        return None
+
+    def mark_done(self, url):
+        """Mark a url as crawled and drop it from the frontier"""
+        url_id = self.intern(url)
+        if self.status[url_id] == TODO:
+            self.n_todo -= 1
+        if self.status[url_id] != DONE:
+            self.status[url_id] = DONE
+            self.n_done += 1
+
+    def skip(self, url):
+        """
+        Drop a url from the frontier without crawling it. Skipped urls can
+        be put back on the frontier with requeue_skipped.
+        """
+        url_id = self.intern(url)
+        if self.status[url_id] == TODO:
+            self.n_todo -= 1
+            self.status[url_id] = SKIPPED
+
+    def defer(self, url, offset):
+        """
+        Move the url at the top of the frontier back by adding offset to its
+        priority. A url is deferred at most once, see is_deferred.
+        """
+        url_id = self.intern(url)
+        if self.status[url_id] != TODO:
+            return
+        priority = offset
+        if self.frontier and self.frontier[0][2] == url_id:
+            priority += heapq.heappop(self.frontier)[0]
+        self._seq += 1
+        heapq.heappush(self.frontier, (priority, self._seq, url_id))
+        self.deferred_ids.add(url_id)
+
+    def is_deferred(self, url):
+        """Returns True if the url was deferred before"""
+        url_id = self.url_ids.get(url)
+        return url_id is not None and url_id in self.deferred_ids
+
+    def get_validators(self, url):
+        """(etag, last_modified) of the last fetch or None"""
+        url_id = self.url_ids.get(url)
+        if url_id is None:
+            return None
+        record = self.get_record(url_id)
+        if record is None or (record.etag is None and record.last_modified is None):
+            return None
+        return record.etag, record.last_modified
+
+    def requeue_skipped(self, priority_function=None):
+        """
+        Put all skipped urls back on the frontier.
+
+        Returns:
+        int: Number of requeued urls.
+        """
+        return self.requeue(flags=(SKIPPED,), priority_function=priority_function)
+
+    def requeue(self, flags=(SKIPPED,), priority_function=None):
+        """
+        Put all urls with one of the given status flags back on the frontier
+        (e.g. flags=(DONE, SKIPPED) to recrawl everything).
+
+        Parameters:
+        flags (tuple): Status flags to requeue (default is (SKIPPED,)).
+        priority_function (Callable): see add_links (default is None).
+
+        Returns:
+        int: Number of requeued urls.
+        """
+        n_requeued = 0
+        for url_id, url_status in enumerate(self.status):
+            if url_status not in flags or url_status == TODO:
+                continue
+            priority = 0.0
+            if priority_function is not None:
+                priority = priority_function(self.urls[url_id], self.depth[url_id])
+                if priority is None:
+                    continue
+            if url_status == DONE:
+                self.n_done -= 1
+                self.status[url_id] = KNOWN
+            self.deferred_ids.discard(url_id)
+            self.push(url_id, priority)
+            n_requeued += 1
+        return n_requeued
+
+    def change_rate(self, url):
+        """
+        Share of past fetches in which the file_hash of a url changed,
+        None if the url was never fetched.
+        """
+        url_id = self.url_ids.get(url)
+        if url_id is None:
+            return None
+        record = self.get_record(url_id)
+        if record is None or record.n_fetches < 2:
+            return None
+        return record.n_changes / (record.n_fetches - 1)
+
+    def iter_status(self, flag):
+        """Yield all urls with the given status flag"""
+        for url_id, url_status in enumerate(self.status):
+            if url_status == flag:
+                yield self.urls[url_id]
+
+    # knowledge base records
+    def store(self, 
+              url, 
+              storage_location, 
+              file_hash, 
+              neighbour_list, 
+              content_hash=None, 
+              simhash=None, 
+              numbers_hash=None,
+              etag=None,
+              last_modified=None,
+              changed=None):
+        """
+        Add (or replace) the knowledge base record of a url. If the content
+        did not change, the record keeps the fingerprints of the version on
+        disk and only the fetch count (and the validators) are updated, so
+        small changes cannot add up unnoticed over several fetches.
+
+        Parameters:
+        changed (bool): Whether the content changed since the last written
+            version (default is None, i.e. compare the file_hash).
+        """
+        url_id = self.intern(url)
+        old_record = self.get_record(url_id)
+        if old_record is not None:
+            if changed is None:
+                changed = old_record.file_hash != file_hash
+            if not changed:
+                old_record.n_fetches += 1
+                old_record.etag = etag
+                old_record.last_modified = last_modified
+                if url_id in self.spilled_ids:
+                    self._get_shelf()[str(url_id)] = old_record
+                return
+
+        neighbour_ids = array('I', (self.intern(link) for link in neighbour_list))
+        record = CrawlRecord(storage_location=sys.intern(storage_location),
+                             file_hash=file_hash,
+                             neighbour_ids=neighbour_ids,
+                             content_hash=content_hash,
+                             simhash=simhash,
+                             numbers_hash=numbers_hash,
+                             etag=etag,
+                             last_modified=last_modified)
+        if old_record is not None:
+            record.n_fetches = old_record.n_fetches + 1
+            record.n_changes = old_record.n_changes + 1
+
+        self._drop_record(url_id)
+        self.records[url_id] = record
+        self.record_bytes += record.nbytes()
+
+        if self.memory_budget is not None and self.record_bytes > self.memory_budget:
+            self._spill()
+
+    def get_record(self, url_id):
+        """Return the record of a url id, reading it from disk if spilled"""
+        record = self.records.get(url_id)
+        if record is None and url_id in self.spilled_ids:
+            record = self._get_shelf()[str(url_id)]
+        return record
+
+    def record_ids(self):
+        """Yield the ids of all urls with a record"""
+        yield from list(self.records)
+        yield from sorted(self.spilled_ids)
+
+    @property
+    def n_records(self):
+        return len(self.records) + len(self.spilled_ids)
+
+    def record_as_dict(self, record):
+        """Expand a compact record into the knowledge base layout"""
+        return {
+            'storage_location': record.storage_location,
+            'file_hash': record.file_hash,
+            'neighbour_list': [self.urls[link_id] for link_id in record.neighbour_ids],
+            'content_hash': record.content_hash,
+            'simhash': None if record.simhash is None else f'{record.simhash:016x}',
+        }
+
+    def _drop_record(self, url_id):
+        old_record = self.records.pop(url_id, None)
+        if old_record is not None:
+            self.record_bytes -= old_record.nbytes()
+        # the key stays in the shelf, a saved checkpoint may still refer to
+        # it (it is overwritten if the record is spilled again)
+        self.spilled_ids.discard(url_id)
+
+    def _spill(self):
+        """
+        Move the oldest records to disk until half of the memory budget is
+        free again (dicts keep insertion order, so the oldest come first).
+        """
+        shelf = self._get_shelf()
+        target = self.memory_budget // 2
+        while self.records and self.record_bytes > target:
+            url_id = next(iter(self.records))
+            record = self.records.pop(url_id)
+            self.record_bytes -= record.nbytes()
+            shelf[str(url_id)] = record
+            self.spilled_ids.add(url_id)
+        shelf.sync()
+
+    def _get_shelf(self):
+        if self._shelf is None:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            self._shelf = shelve.open(os.path.join(self.spill_dir, 'crawl_state_spill'))
+        return self._shelf
+
+    def close(self):
+        """Close the spill file (if any)"""
+        if self._shelf is not None:
+            self._shelf.close()
+            self._shelf = None
+
+    # persistence
+    def save(self, path):
+        """
+        Pickle the state to path and write the memory report next to it
+        (path with a .json suffix), which can be read without loading the
+        state, see read_summary.
+        """
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'wb') as con:
+            pickle.dump(self, con, protocol=pickle.HIGHEST_PROTOCOL)
+
+        summary = self.memory_report()
+        summary['saved_at'] = time.strftime('%Y-%m-%d %H:%M:%S')
+        with open(os.path.splitext(path)[0] + '.json', 'w') as con:
+            json.dump(summary, con, indent=2)
+
+    @staticmethod
+    def load(path):
+        """Load a state saved with save"""
+        with open(path, 'rb') as con:
+            return pickle.load(con)
+
+    @staticmethod
+    def read_summary(path):
+        """Read the summary written by save (path of the state)"""
+        with open(os.path.splitext(path)[0] + '.json') as con:
+            return json.load(con)
+
+    # reporting
+    def memory_report(self):
+        """
+        Approximate memory usage of the crawl state.
+
+        Returns:
+        dict: Byte counts of the different parts and the bytes used per url.
+        """
+        bytes_urls = (sys.getsizeof(self.urls)
+                      + sys.getsizeof(self.url_ids)
+                      + sum(sys.getsizeof(url) for url in self.urls))
+        bytes_status = (sys.getsizeof(self.status)
+                        + sys.getsizeof(self.depth)
+                        + sys.getsizeof(self.deferred_ids)
+                        + sys.getsizeof(self.spilled_ids))
+        # (priority, seq, url_id) per entry
+        bytes_frontier = sys.getsizeof(self.frontier) + sum(
+            sys.getsizeof(entry) + sum(sys.getsizeof(item) for item in entry)
+            for entry in self.frontier)
+        bytes_records = sys.getsizeof(self.records) + self.record_bytes
+        bytes_total = bytes_urls + bytes_status + bytes_frontier + bytes_records
+        n_urls = len(self.urls)
+
+        return {
+            'n_urls': n_urls,
+            'n_todo': self.n_todo,
+            'n_done': self.n_done,
+            'records_in_memory': len(self.records),
+            'records_spilled': len(self.spilled_ids),
+            'bytes_urls': bytes_urls,
+            'bytes_status': bytes_status,
+            'bytes_frontier': bytes_frontier,
+            'bytes_records': bytes_records,
+            'bytes_total': bytes_total,
+            'bytes_per_url': bytes_total / n_urls if n_urls else 0.0,
+        }
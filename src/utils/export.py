@@ -0,0 +1,211 @@
+"""
+Streaming export of crawl records to JSONL and Parquet
+"""
+import os
+import json
+
+
+SCHEMA_VERSION = 1
+
+# column name -> column kind, the kinds are mapped to arrow types for parquet
+KNOWLEDGE_BASE_FIELDS = {
+    'url': 'string',
+    'storage_location': 'string',
+    'file_hash': 'string',
+    'neighbour_list': 'list<string>',
+    'content_hash': 'string',
+    'simhash': 'string',
+}
+
+LEGAL_FIELDS = {
+    'file_name': 'string',
+    'sr_number': 'string',
+    'titel': 'string',
+    'abbreviation': 'string',
+    'sr_uri': 'string',
+    'citing_article': 'list<map>',
+    'cited_in_article': 'list<map>',
+    # filled by FedlexScraper.refresh only
+    'consolidation': 'string',
+    'date_applicability': 'string',
+}
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as err:
+        raise ImportError('pyarrow is needed for the parquet export,\
+                          install it or use formats=("jsonl",)') from err
+    return pyarrow, pyarrow.parquet
+
+
+def _arrow_schema(fields):
+    pa, _ = _import_pyarrow()
+    kinds = {
+        'string': pa.string(),
+        'list<string>': pa.list_(pa.string()),
+        'list<map>': pa.list_(pa.map_(pa.string(), pa.string())),
+    }
+    return pa.schema([(name, kinds[kind]) for name, kind in fields.items()],
+                     metadata={'schema_version': str(SCHEMA_VERSION)})
+
+
+def _check_version(version, path):
+    if int(version) > SCHEMA_VERSION:
+        raise ValueError(f'{path} has schema version {version}, only\
+                         versions up to {SCHEMA_VERSION} are supported')
+
+
+class RecordExporter:
+    """
+    Writes records (dicts) to write_dir/name.jsonl and/or write_dir/name.parquet
+    in batches of batch_size rows, so the crawl never holds more than one
+    batch in memory. The JSONL file starts with a header line containing
+    the schema version, the parquet file stores it in the schema metadata.
+
+    Parameters:
+    write_dir (str): Directory to write to.
+    name (str): File name without extension.
+    fields (dict): Column name -> kind (see KNOWLEDGE_BASE_FIELDS).
+    formats (tuple): Any of 'jsonl' and 'parquet' (default is ('jsonl',)).
+    batch_size (int): Number of rows per batch (default is 500).
+
+    Examples:
+    >>> with RecordExporter('export', 'knowledge_base', KNOWLEDGE_BASE_FIELDS) as exporter:
+    ...     exporter.write({'url': url, 'file_hash': hex_hash})
+    """
+    def __init__(self,
+                 write_dir,
+                 name,
+                 fields,
+                 formats=('jsonl',),
+                 batch_size=500) -> None:
+        unknown = set(formats) - {'jsonl', 'parquet'}
+        if unknown:
+            raise ValueError(f'unknown export formats {unknown}')
+
+        self.fields = fields
+        self.batch_size = batch_size
+        self.n_written = 0
+        self._rows = []
+
+        os.makedirs(write_dir, exist_ok=True)
+        self.jsonl_path = None
+        self.parquet_path = None
+        self._jsonl = None
+        self._parquet = None
+        self._arrow_schema = None
+
+        if 'parquet' in formats:
+            _, pq = _import_pyarrow()
+            self.parquet_path = os.path.join(write_dir, name + '.parquet')
+            self._arrow_schema = _arrow_schema(fields)
+            self._parquet = pq.ParquetWriter(self.parquet_path, self._arrow_schema)
+
+        if 'jsonl' in formats:
+            self.jsonl_path = os.path.join(write_dir, name + '.jsonl')
+            self._jsonl = open(self.jsonl_path, 'w', encoding='utf-8')
+            header = {'schema_version': SCHEMA_VERSION, 'fields': fields}
+            self._jsonl.write(json.dumps(header) + '\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, record):
+        """Add a record, the batch is written once it is full"""
+        row = {}
+        for name, kind in self.fields.items():
+            value = record.get(name)
+            if kind == 'list<map>':
+                # failed citation queries are stored as {}
+                value = list(value) if value else []
+            row[name] = value
+        self._rows.append(row)
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write the current batch"""
+        if not self._rows:
+            return
+        if self._jsonl is not None:
+            self._jsonl.writelines(json.dumps(row, ensure_ascii=False) + '\n'
+                                   for row in self._rows)
+            self._jsonl.flush()
+        if self._parquet is not None:
+            pa, _ = _import_pyarrow()
+            arrow_rows = [self._to_arrow_row(row) for row in self._rows]
+            table = pa.Table.from_pylist(arrow_rows, schema=self._arrow_schema)
+            self._parquet.write_table(table)
+        self.n_written += len(self._rows)
+        self._rows = []
+
+    def close(self):
+        """Write the remaining rows and close the files"""
+        self.flush()
+        if self._jsonl is not None:
+            self._jsonl.close()
+            self._jsonl = None
+        if self._parquet is not None:
+            self._parquet.close()
+            self._parquet = None
+
+    def _to_arrow_row(self, row):
+        arrow_row = dict(row)
+        for name, kind in self.fields.items():
+            if kind == 'list<map>':
+                arrow_row[name] = [list(item.items()) for item in row[name]]
+        return arrow_row
+
+
+def iter_export(path, columns=None, batch_size=10_000):
+    """
+    Lazily read the records of an export file (jsonl or parquet).
+
+    Parameters:
+    path (str): Path of the export file.
+    columns (list): Only return these columns (default is None, i.e. all).
+    batch_size (int): Rows read at once from parquet files (default is 10_000).
+
+    Returns:
+    generator: One dict per record.
+    """
+    if path.endswith('.parquet'):
+        _, pq = _import_pyarrow()
+        parquet_file = pq.ParquetFile(path)
+        metadata = parquet_file.schema_arrow.metadata or {}
+        _check_version(metadata.get(b'schema_version', 0), path)
+        for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+            yield from batch.to_pylist()
+    else:
+        with open(path, encoding='utf-8') as con:
+            header = json.loads(next(con))
+            _check_version(header['schema_version'], path)
+            for line in con:
+                row = json.loads(line)
+                if columns is not None:
+                    row = {name: row.get(name) for name in columns}
+                yield row
+
+
+def load_export(path, columns=None):
+    """
+    Load (selected columns of) a parquet export as a pyarrow Table.
+
+    Parameters:
+    path (str): Path of the parquet file.
+    columns (list): Only load these columns (default is None, i.e. all).
+
+    Returns:
+    pyarrow.Table: The loaded records.
+    """
+    _, pq = _import_pyarrow()
+    table = pq.read_table(path, columns=columns)
+    metadata = pq.read_schema(path).metadata or {}
+    _check_version(metadata.get(b'schema_version', 0), path)
+    return table
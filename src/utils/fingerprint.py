@@ -0,0 +1,174 @@
+"""
+Content fingerprints: exact hash of the raw bytes, a hash of the main
+content without boilerplate and a SimHash for near duplicate detection
+"""
+import re
+import zlib
+import hashlib
+
+from bs4 import BeautifulSoup
+from bs4.element import Tag, NavigableString, PreformattedString
+
+
+# Subtrees that never hold the main content of a page
+BOILERPLATE_TAGS = {'script', 'style', 'noscript', 'template', 'iframe',
+                    'nav', 'header', 'footer', 'aside', 'form', 'button'}
+BOILERPLATE_PATTERN = re.compile(
+    r'nav|menu|footer|header|breadcrumb|cookie|banner|skip|social|share|'
+    r'search|sidebar|teaser|language|lang-|print|back-to-top',
+    re.IGNORECASE)
+# "last changed" stamps that change with every build of a page, dates
+# elsewhere in the main content are kept (they can be the content)
+_DATE = r'(\d{1,2}\.\d{1,2}\.\d{2,4}|\d{4}-\d{2}-\d{2})'
+_TIME = r'\d{1,2}:\d{2}(:\d{2})?'
+STAMP_PATTERN = re.compile(
+    r'\b(Stand|Letzte Änderung|Letzte Aktualisierung|Zuletzt aktualisiert|'
+    r'Dernière modification|Dernière mise à jour|Ultima modifica|'
+    r'Ultimo aggiornamento|Last modified|Last updated)'
+    r'\s*:?\s*(am|le|il|on)?\s*' + _DATE + r'(,?\s*' + _TIME + r')?',
+    re.IGNORECASE)
+TOKEN_PATTERN = re.compile(r'\w+')
+NUMBER_PATTERN = re.compile(r'\d+')
+
+SIMHASH_BITS = 64
+
+
+def exact_hash(raw_content):
+    """
+    Hash of the raw bytes of a response (same as the former file_hash of
+    binary files)
+    """
+    return hashlib.md5(raw_content).hexdigest()
+
+
+def _is_boilerplate(tag):
+    if tag.name in BOILERPLATE_TAGS:
+        return True
+    if tag.get('role') in ('navigation', 'banner', 'contentinfo', 'search'):
+        return True
+    if tag.get('aria-hidden') == 'true':
+        return True
+    for attribute in ('id', 'class'):
+        value = tag.get(attribute)
+        if value is None:
+            continue
+        if not isinstance(value, str):
+            value = ' '.join(value)
+        if BOILERPLATE_PATTERN.search(value):
+            return True
+    return False
+
+
+def main_text(soup_obj, remove_boilerplate=True):
+    """
+    Text of the main content of a page. The soup is not modified, boilerplate
+    subtrees (navigation, header, footer, scripts, ...) are skipped while
+    walking the tree.
+
+    Parameters:
+    soup_obj (BeautifulSoup): The parsed page.
+    remove_boilerplate (bool): If False, the full text is used as is (e.g.
+        for legal xml) (default is True).
+
+    Returns:
+    str: The main text with normalized whitespace and without "last
+    changed" stamps.
+    """
+    root = soup_obj
+    if remove_boilerplate:
+        root = (soup_obj.find('main')
+                or soup_obj.find(attrs={'role': 'main'})
+                or soup_obj.find('body')
+                or soup_obj)
+
+    parts = []
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Tag):
+            if remove_boilerplate and node is not root and _is_boilerplate(node):
+                continue
+            stack.extend(reversed(node.contents))
+        elif isinstance(node, NavigableString) and not isinstance(node, PreformattedString):
+            # PreformattedString covers comments, CDATA, doctype, ...
+            parts.append(node)
+
+    text = ' '.join(' '.join(parts).split())
+    if remove_boilerplate:
+        text = STAMP_PATTERN.sub(r'\1', text)
+    return text
+
+
+def simhash(text, shingle_size=3):
+    """
+    64 bit SimHash over word shingles of a text.
+
+    Parameters:
+    text (str): The text.
+    shingle_size (int): Number of words per shingle (default is 3).
+
+    Returns:
+    int: The SimHash.
+    """
+    tokens = TOKEN_PATTERN.findall(text.lower())
+    if len(tokens) < shingle_size:
+        shingles = [' '.join(tokens)]
+    else:
+        shingles = [' '.join(tokens[pos:pos + shingle_size])
+                    for pos in range(len(tokens) - shingle_size + 1)]
+
+    weights = {}
+    for shingle in shingles:
+        shingle_hash = int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'),
+                                                      digest_size=8).digest(), 'big')
+        weights[shingle_hash] = weights.get(shingle_hash, 0) + 1
+
+    vector = [0] * SIMHASH_BITS
+    for shingle_hash, weight in weights.items():
+        for bit in range(SIMHASH_BITS):
+            if shingle_hash >> bit & 1:
+                vector[bit] += weight
+            else:
+                vector[bit] -= weight
+
+    fingerprint = 0
+    for bit, value in enumerate(vector):
+        if value > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def numbers_hash(text):
+    """
+    Hash of the sequence of numbers in a text. A changed date or number is
+    a real change even if the SimHash barely moves.
+    """
+    return zlib.crc32(' '.join(NUMBER_PATTERN.findall(text)).encode('ascii'))
+
+
+def hamming_distance(hash_a, hash_b):
+    """Number of differing bits of two SimHashes"""
+    return bin(hash_a ^ hash_b).count('1')
+
+
+def fingerprint(raw_content, soup_obj=None, remove_boilerplate=True):
+    """
+    All fingerprints of a fetched object, computed once per fetch.
+
+    Parameters:
+    raw_content (bytes): The raw response body.
+    soup_obj (BeautifulSoup): The parsed page, None for binary files
+        (default is None).
+    remove_boilerplate (bool): see main_text (default is True).
+
+    Returns:
+    tuple: (exact hash, content hash, simhash, numbers hash), all but the
+    exact hash are None for binary files.
+    """
+    hex_hash = exact_hash(raw_content)
+    if not isinstance(soup_obj, BeautifulSoup):
+        return hex_hash, None, None, None
+
+    text = main_text(soup_obj, remove_boilerplate=remove_boilerplate)
+    content_hash = hashlib.md5(text.encode('utf-8')).hexdigest()
+    return hex_hash, content_hash, simhash(text), numbers_hash(text)
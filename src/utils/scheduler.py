@@ -0,0 +1,157 @@
+"""
+Crawl scheduler: orders the frontier and enforces the crawl budgets
+"""
+import time
+from urllib.parse import urlparse
+
+
+# Lower values are crawled first. html pages are hubs that lead to new
+# links, large binaries come last.
+DEFAULT_TYPE_PRIORITIES = {
+    'html': 0.0,
+    'legal_xml': 1.0,
+    'pdf': 2.0,
+    'xml': 3.0,
+    'xls': 3.0,
+    'xlsx': 3.0,
+    'doc': 3.0,
+    'docx': 3.0,
+    'dotx': 3.0,
+    'pptx': 4.0,
+    'ppt': 4.0,
+    'jpg': 5.0,
+    'png': 5.0,
+    'zip': 6.0,
+    'dxf': 6.0,
+    'dwg': 6.0,
+    'mpg': 8.0,
+    'else': 8.0,
+}
+
+
+class CrawlScheduler:
+    """
+    Computes the priority of a url on the frontier (lower is crawled
+    earlier) and keeps track of the crawl budgets.
+
+    The priority is the sum of
+    * the type priority of the file type (see DEFAULT_TYPE_PRIORITIES)
+    * depth_weight times the link depth
+    * change_weight times (1 - estimated change rate), urls that were never
+      fetched before count as always changing
+    * host_weight times the number of pages already fetched from the host
+
+    Parameters:
+    max_depth (int): Links deeper than this are not crawled (default is None).
+    max_pages (int): Stop after this many fetched pages (default is None).
+    max_seconds (float): Stop after this many seconds (default is None).
+    byte_budgets (dict): Maximal number of bytes to download per write_split
+        category, e.g. {'cad': 500_000_000} (default is None).
+    type_priorities (dict): Priority per file type, overrides the defaults
+        (default is None).
+    depth_weight (float): Weight of the link depth (default is 1.0).
+    change_weight (float): Weight of the change frequency (default is 2.0).
+    host_weight (float): Weight of the host fairness term (default is 0.001).
+    defer_offset (float): Added to the priority of deferred urls (default is 1000.0).
+
+    Examples:
+    >>> scheduler = CrawlScheduler(max_depth=4, max_pages=5000,
+    ...                            byte_budgets={'else': 0, 'cad': 10**8})
+    >>> astra_scraper = AstraScraper(scheduler=scheduler)
+    """
+    def __init__(self,
+                 max_depth=None,
+                 max_pages=None,
+                 max_seconds=None,
+                 byte_budgets=None,
+                 type_priorities=None,
+                 depth_weight=1.0,
+                 change_weight=2.0,
+                 host_weight=0.001,
+                 defer_offset=1000.0) -> None:
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.max_seconds = max_seconds
+        self.byte_budgets = byte_budgets or {}
+
+        self.type_priorities = dict(DEFAULT_TYPE_PRIORITIES)
+        if type_priorities is not None:
+            self.type_priorities.update(type_priorities)
+
+        self.depth_weight = depth_weight
+        self.change_weight = change_weight
+        self.host_weight = host_weight
+        self.defer_offset = defer_offset
+
+        self.reset()
+
+    def reset(self):
+        """Reset the counters (done at the start of every crawl)"""
+        self.start_time = time.monotonic()
+        self.pages_fetched = 0
+        self.bytes_fetched = {}
+        self.host_counts = {}
+
+    def priority(self, url, depth, file_type, change_rate=None):
+        """
+        Priority of a url, None if the url should not be crawled at all.
+
+        Parameters:
+        url (str): The url.
+        depth (int): Link depth of the url.
+        file_type (str): File type as returned by _get_filenames.
+        change_rate (float): Share of past fetches with a changed file_hash,
+            None if unknown (default is None).
+
+        Returns:
+        float or None: The priority (lower is crawled earlier).
+        """
+        if self.max_depth is not None and depth > self.max_depth:
+            return None
+
+        type_priority = self.type_priorities.get(file_type,
+                                                 self.type_priorities['else'])
+        if change_rate is None:
+            change_rate = 1.0
+        host_count = self.host_counts.get(self._get_host(url), 0)
+
+        return (type_priority
+                + self.depth_weight * depth
+                + self.change_weight * (1.0 - change_rate)
+                + self.host_weight * host_count)
+
+    def admit(self, category):
+        """
+        Returns False if the byte budget of a write_split category is used up.
+        """
+        budget = self.byte_budgets.get(category)
+        if budget is None:
+            return True
+        return self.bytes_fetched.get(category, 0) < budget
+
+    def record_fetch(self, url, category, n_bytes):
+        """
+        Update the counters after a fetch.
+
+        Parameters:
+        url (str): The fetched url.
+        category (str): write_split category of the stored object.
+        n_bytes (int): Number of downloaded bytes.
+        """
+        self.pages_fetched += 1
+        self.bytes_fetched[category] = self.bytes_fetched.get(category, 0) + n_bytes
+        host = self._get_host(url)
+        self.host_counts[host] = self.host_counts.get(host, 0) + 1
+
+    def exhausted(self):
+        """Returns True if the page or time budget is used up"""
+        if self.max_pages is not None and self.pages_fetched >= self.max_pages:
+            return True
+        if self.max_seconds is not None and \
+                time.monotonic() - self.start_time >= self.max_seconds:
+            return True
+        return False
+
+    def _get_host(self, url):
+        # relative links belong to the crawled domain
+        return urlparse(url).netloc
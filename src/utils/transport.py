@@ -0,0 +1,201 @@
+"""
+HTTP transport with an on-disk record/replay cache for offline crawl runs
+"""
+import os
+import time
+import json
+import zlib
+import shelve
+import hashlib
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+LIVE = 'live'
+RECORD = 'record'
+REPLAY = 'replay'
+
+
+class CachedResponse:
+    """
+    Minimal stand-in for requests.Response, served from the cache.
+    """
+    def __init__(self, url, status_code, headers, content):
+        self.url = url
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.content = content
+        self.encoding = 'utf-8'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding, errors='replace')
+
+    def iter_content(self, chunk_size=65536, decode_unicode=False):
+        data = self.text if decode_unicode else self.content
+        for start in range(0, len(data), chunk_size):
+            yield data[start:start + chunk_size]
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f'{self.status_code} for url: {self.url}')
+
+    def close(self):
+        pass
+
+
+class HttpTransport:
+    """
+    All network access of the scrapers goes through a transport. In 'live'
+    mode it simply uses a requests session, in 'record' mode every response
+    (status, headers and the zlib compressed body) and every wrapped call
+    (e.g. isolate_legal_xml) is also written to a shelve in store_dir, in
+    'replay' mode everything is served from that store without touching the
+    network.
+
+    Replayed responses can be delayed to simulate the network: every reply
+    sleeps latency + latency_scale * recorded duration seconds.
+
+    Parameters:
+    store_dir (str): Directory of the store, needed for record and replay
+        (default is None).
+    mode (str): 'live', 'record' or 'replay' (default is 'live').
+    latency (float): Fixed delay per replayed request in seconds (default is 0).
+    latency_scale (float): Factor on the recorded duration (default is 0,
+        i.e. replay at full speed).
+
+    Examples:
+    >>> transport = HttpTransport('cache', mode='record')
+    >>> AstraScraper(transport=transport).crawl_page(write_dir='my_write_dir')
+    >>> transport = HttpTransport('cache', mode='replay', latency_scale=1.0)
+    """
+    def __init__(self,
+                 store_dir=None,
+                 mode=LIVE,
+                 latency=0.0,
+                 latency_scale=0.0) -> None:
+        if mode not in (LIVE, RECORD, REPLAY):
+            raise ValueError(f'unknown transport mode {mode}')
+        if mode != LIVE and store_dir is None:
+            raise ValueError('A store_dir needs to be defined if using\
+                             record or replay mode')
+        self.store_dir = store_dir
+        self.mode = mode
+        self.latency = latency
+        self.latency_scale = latency_scale
+        self.session = requests.Session()
+        self.n_replayed = 0
+        self.n_recorded = 0
+        self._shelf = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self._shelf is not None:
+            self._shelf.sync()
+        state['_shelf'] = None
+        return state
+
+    def get(self, url, params=None, headers=None, **kwargs):
+        """Same as requests.get (goes through the cache if not live)"""
+        return self.request('GET', url, params=params, headers=headers, **kwargs)
+
+    def head(self, url, params=None, headers=None, **kwargs):
+        """Same as requests.head (goes through the cache if not live)"""
+        return self.request('HEAD', url, params=params, headers=headers, **kwargs)
+
+    def request(self, method, url, params=None, headers=None, **kwargs):
+        """
+        Send (or replay) a request.
+
+        Returns:
+        requests.Response or CachedResponse: The response.
+        """
+        if self.mode == LIVE:
+            return self.session.request(method, url, params=params, headers=headers, **kwargs)
+
+        key = self._key('http', method, url, params, (headers or {}).get('Range'))
+        if self.mode == REPLAY:
+            status_code, response_headers, body, duration = self._replay(key, url)
+            return CachedResponse(url, status_code, response_headers, zlib.decompress(body))
+
+        start = time.perf_counter()
+        response = self.session.request(method, url, params=params, headers=headers, **kwargs)
+        # a ranged GET is only used to read the headers, do not download more
+        if method == 'HEAD' or (headers or {}).get('Range'):
+            content = b''
+            response.close()
+        else:
+            content = response.content
+        duration = time.perf_counter() - start
+
+        self._record(key, (response.status_code,
+                           dict(response.headers),
+                           zlib.compress(content),
+                           duration))
+        return CachedResponse(response.url, response.status_code, response.headers, content)
+
+    def call(self, name, function, *args, **kwargs):
+        """
+        Call function (e.g. isolate_legal_xml) or replay its recorded outcome.
+        Raised exceptions are recorded and re-raised as well.
+
+        Parameters:
+        name (str): Name of the call in the store.
+        function (Callable): The function, its result has to be picklable.
+        """
+        if self.mode == LIVE:
+            return function(*args, **kwargs)
+
+        key = self._key('call', name, args, sorted(kwargs.items()))
+        if self.mode == REPLAY:
+            outcome, failed, duration = self._replay(key, name)
+        else:
+            start = time.perf_counter()
+            try:
+                outcome, failed = function(*args, **kwargs), False
+            except Exception as err:
+                outcome, failed = err, True
+            duration = time.perf_counter() - start
+            self._record(key, (outcome, failed, duration))
+
+        if failed:
+            raise outcome
+        return outcome
+
+    def close(self):
+        """Close the store (if open)"""
+        if self._shelf is not None:
+            self._shelf.close()
+            self._shelf = None
+
+    def _key(self, *parts):
+        return hashlib.sha1(json.dumps(parts, default=repr).encode('utf-8')).hexdigest()
+
+    def _record(self, key, entry):
+        self.n_recorded += 1
+        self._get_shelf()[key] = entry
+
+    def _replay(self, key, name):
+        shelf = self._get_shelf()
+        if key not in shelf:
+            raise LookupError(f'no recorded response for {name}')
+        self.n_replayed += 1
+        entry = shelf[key]
+        delay = self.latency + self.latency_scale * entry[-1]
+        if delay > 0:
+            time.sleep(delay)
+        return entry
+
+    def _get_shelf(self):
+        if self._shelf is None:
+            os.makedirs(self.store_dir, exist_ok=True)
+            flag = 'r' if self.mode == REPLAY else 'c'
+            self._shelf = shelve.open(os.path.join(self.store_dir, 'transport_cache'), flag=flag)
+        return self._shelf
@@ -0,0 +1,101 @@
+"""
+Offline tests of the incremental fedlex crawl (FedlexScraper.refresh)
+"""
+import re
+import json
+
+from src.scraper import FedlexScraper
+
+
+URI_A = 'https://fedlex.data.admin.ch/eli/cc/1999/404'
+URI_B = 'https://fedlex.data.admin.ch/eli/cc/2000/1'
+
+
+class FakeFedlexClient:
+    """Serves the versions and the in-force listing from memory"""
+    def __init__(self):
+        self.versions = []
+        self.in_force = []
+        self.since = []
+
+    def select_paged(self, query, page_size=1000, order_by=None, keyset_var=None):
+        if '?consolidation' in query:
+            since = re.search(r'xsd:date\("([\d-]+)"\)', query)
+            self.since.append(None if since is None else since[1])
+            yield from (dict(row) for row in self.versions)
+        else:
+            yield from ({'sr_uri': sr_uri} for sr_uri in self.in_force)
+
+
+def _version(sr_uri, consolidation, titel='title'):
+    return {'sr_number': '1', 'titel': titel, 'abbreviation': 'abbr',
+            'sr_uri': sr_uri, 'consolidation': consolidation,
+            'date_applicability': '2024-01-01'}
+
+
+def _scraper(client):
+    scraper = FedlexScraper(client=client)
+    scraper.crawled = []
+    scraper._crawl_legal_entry = lambda legal_entry, file_name, write_dir, exporter=None: \
+        scraper.crawled.append((legal_entry['sr_uri'], file_name))
+    return scraper
+
+
+def _set_last_run(versions_path, last_run):
+    with open(versions_path) as con:
+        versions = json.load(con)
+    versions['last_run'] = last_run
+    with open(versions_path, 'w') as con:
+        json.dump(versions, con)
+
+
+def test_refresh_reports_added_amended_repealed(tmp_path):
+    versions_path = str(tmp_path / 'fedlex_versions.json')
+    client = FakeFedlexClient()
+    scraper = _scraper(client)
+
+    # first run: everything is new, several rows of a law are crawled once
+    client.versions = [_version(URI_A, 'a1', 'de'), _version(URI_A, 'a1', 'fr'),
+                       _version(URI_B, 'b1')]
+    report = scraper.refresh(versions_path, write_dir=str(tmp_path))
+
+    assert report == {'added': [URI_A, URI_B], 'amended': [], 'repealed': []}
+    assert scraper.crawled == [(URI_A, 'legal_eli_cc_1999_404.pkl'),
+                               (URI_B, 'legal_eli_cc_2000_1.pkl')]
+    assert client.since == [None]
+
+    # second run: A amended, B unchanged but no longer in force
+    _set_last_run(versions_path, '2024-06-30')
+    scraper.crawled = []
+    client.versions = [_version(URI_A, 'a2'), _version(URI_B, 'b1')]
+    client.in_force = [URI_A]
+    report = scraper.refresh(versions_path, write_dir=str(tmp_path), overlap_days=30)
+
+    assert report == {'added': [], 'amended': [URI_A], 'repealed': [URI_B]}
+    assert scraper.crawled == [(URI_A, 'legal_eli_cc_1999_404.pkl')]
+    # the query overlaps the last run
+    assert client.since[-1] == '2024-05-31'
+
+    with open(versions_path) as con:
+        versions = json.load(con)
+    assert list(versions['laws']) == [URI_A]
+    assert versions['laws'][URI_A]['consolidation'] == 'a2'
+    assert versions['last_run'] != '2024-06-30'
+
+
+def test_refresh_ignores_an_empty_in_force_listing(tmp_path):
+    versions_path = str(tmp_path / 'fedlex_versions.json')
+    client = FakeFedlexClient()
+    scraper = _scraper(client)
+
+    client.versions = [_version(URI_A, 'a1'), _version(URI_B, 'b1')]
+    scraper.refresh(versions_path, write_dir=str(tmp_path))
+
+    scraper.crawled = []
+    client.in_force = []
+    report = scraper.refresh(versions_path, write_dir=str(tmp_path))
+
+    assert report == {'added': [], 'amended': [], 'repealed': []}
+    assert scraper.crawled == []
+    with open(versions_path) as con:
+        assert sorted(json.load(con)['laws']) == [URI_A, URI_B]
@@ -0,0 +1,69 @@
+"""
+Offline tests of the SPARQL result streaming and the keyset pagination
+"""
+import re
+import json
+
+import pytest
+
+from src.legal.sparqlqueries import SparqlClient, iter_bindings
+
+
+class FakeClient(SparqlClient):
+    """Serves the keyset pages of a fixed result from memory"""
+    def __init__(self, rows):
+        super().__init__()
+        self.rows = sorted(rows, key=lambda row: row['sr_uri'])
+        self.queries = []
+
+    def select(self, query):
+        self.queries.append(query)
+        after = re.search(r'STR\(\?sr_uri\) > "(.*)"', query)
+        limit = int(re.search(r'LIMIT (\d+)', query)[1])
+        rows = [row for row in self.rows
+                if after is None or row['sr_uri'] > after[1]]
+        yield from rows[:limit]
+
+
+def _rows(n_titles):
+    return [{'sr_uri': f'uri_{key}', 'titel': f'title_{key}_{title}'}
+            for key, n_title in enumerate(n_titles)
+            for title in range(n_title)]
+
+
+@pytest.mark.parametrize('page_size', [4, 5, 10])
+def test_keyset_keeps_multi_row_keys(page_size):
+    rows = _rows([2, 3, 1, 2, 3, 1, 2])
+    client = FakeClient(rows)
+
+    result = list(client.select_paged('SELECT * WHERE { __KEYSET__ }',
+                                      page_size=page_size,
+                                      keyset_var='sr_uri'))
+
+    assert result == client.rows
+
+
+def test_keyset_needs_a_page_per_key():
+    client = FakeClient(_rows([3, 1]))
+
+    with pytest.raises(ValueError):
+        list(client.select_paged('SELECT * WHERE { __KEYSET__ }',
+                                 page_size=2,
+                                 keyset_var='sr_uri'))
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 1000])
+def test_iter_bindings_over_chunks(chunk_size):
+    bindings = [{'sr_uri': {'type': 'uri', 'value': f'uri_{pos}'},
+                 'titel': {'type': 'literal', 'value': 'a, b ] {c}'}}
+                for pos in range(5)]
+    body = json.dumps({'head': {'vars': ['sr_uri', 'titel']},
+                       'results': {'bindings': bindings}}, indent=1)
+    chunks = [body[pos:pos + chunk_size] for pos in range(0, len(body), chunk_size)]
+
+    assert list(iter_bindings(chunks)) == bindings
+
+
+def test_iter_bindings_empty_result():
+    body = '{"head": {"vars": []}, "results": {"bindings": []}}'
+    assert list(iter_bindings([body])) == []